@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ad lifecycle store for Meta Ad Library cards, keyed by ``ad_archive_id``.
+
+``ads`` holds the current state of every ad ever seen (creative fields, first_seen,
+last_seen, active/ended_at); ``ad_events`` is an append-only log of launched / changed /
+reactivated / ended / manual events. Each run upserts only new or changed ads, and
+``close_out`` marks ads that disappeared from a fully harvested advertiser as ended, so
+launch and kill velocity per competitor is an indexed query instead of a CSV diff.
+"""
+
+import datetime as dt
+import hashlib
+import re
+import sqlite3
+import threading
+from pathlib import Path
+
+CREATIVE_FIELDS = ["start_date", "primary_text", "headline", "call_to_action", "landing_page_url"]
+ARCHIVE_ID_RE = re.compile(r"\d{6,}")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ads (
+    ad_archive_id TEXT PRIMARY KEY,
+    competitor_name TEXT NOT NULL,
+    ad_library_url TEXT NOT NULL DEFAULT '',
+    start_date TEXT NOT NULL DEFAULT '',
+    primary_text TEXT NOT NULL DEFAULT '',
+    headline TEXT NOT NULL DEFAULT '',
+    call_to_action TEXT NOT NULL DEFAULT '',
+    landing_page_url TEXT NOT NULL DEFAULT '',
+    content_hash TEXT NOT NULL,
+    source TEXT NOT NULL,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL,
+    active INTEGER NOT NULL DEFAULT 1,
+    ended_at TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS ads_comp_active ON ads (competitor_name, active, last_seen);
+CREATE INDEX IF NOT EXISTS ads_comp_first_seen ON ads (competitor_name, first_seen);
+CREATE INDEX IF NOT EXISTS ads_comp_ended ON ads (competitor_name, ended_at);
+CREATE TABLE IF NOT EXISTS ad_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ad_archive_id TEXT NOT NULL,
+    competitor_name TEXT NOT NULL,
+    event TEXT NOT NULL,
+    at TEXT NOT NULL,
+    content_hash TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS ad_events_comp ON ad_events (competitor_name, event, at);
+"""
+
+VELOCITY_FIELDS = ["competitor_name", "active_ads", "launched_7d", "ended_7d", "launched_30d", "ended_30d", "first_seen", "last_seen"]
+
+
+def creative_hash(card):
+    raw = "\x1f".join((card.get(f, "") or "").strip() for f in CREATIVE_FIELDS)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def archive_ids(value):
+    """Archive ids found in a manual ``ad_id_or_archive_id`` cell (bare id or Ad Library URL)."""
+    value = (value or "").strip()
+    ids = ARCHIVE_ID_RE.findall(value)
+    return ids or ([value] if value and " " not in value and "/" not in value else [])
+
+
+class AdStore:
+    def __init__(self, path, run_at=None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.run_at = run_at or dt.datetime.now().isoformat(timespec="seconds")
+        self.stats = {"launched": 0, "changed": 0, "reactivated": 0, "unchanged": 0, "ended": 0, "manual": 0}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript(SCHEMA)
+
+    def _event(self, ad_id, competitor, event, content_hash=""):
+        self._db.execute(
+            "INSERT INTO ad_events (ad_archive_id, competitor_name, event, at, content_hash) VALUES (?, ?, ?, ?, ?)",
+            (ad_id, competitor, event, self.run_at, content_hash),
+        )
+
+    def observe(self, cards):
+        """Upsert cards harvested in this run; only new, changed or revived ads are rewritten."""
+        with self._lock, self._db:
+            for card in cards:
+                ad_id = (card.get("ad_archive_id", "") or "").strip()
+                if not ad_id:
+                    continue
+                comp = card.get("competitor_name", "")
+                digest = creative_hash(card)
+                cur = self._db.execute("SELECT content_hash, active FROM ads WHERE ad_archive_id = ?", (ad_id,)).fetchone()
+                values = [card.get(f, "") or "" for f in CREATIVE_FIELDS]
+                if cur is None:
+                    self._db.execute(
+                        "INSERT INTO ads (ad_archive_id, competitor_name, ad_library_url, " + ", ".join(CREATIVE_FIELDS)
+                        + ", content_hash, source, first_seen, last_seen) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'web_auto', ?, ?)",
+                        [ad_id, comp, card.get("ad_library_url", "")] + values + [digest, self.run_at, self.run_at],
+                    )
+                    event = "launched"
+                elif cur["content_hash"] != digest:
+                    self._db.execute(
+                        "UPDATE ads SET " + ", ".join(f"{f} = ?" for f in CREATIVE_FIELDS)
+                        + ", content_hash = ?, last_seen = ?, active = 1, ended_at = '' WHERE ad_archive_id = ?",
+                        values + [digest, self.run_at, ad_id],
+                    )
+                    event = "changed"
+                else:
+                    self._db.execute("UPDATE ads SET last_seen = ?, active = 1, ended_at = '' WHERE ad_archive_id = ?", (self.run_at, ad_id))
+                    event = "unchanged" if cur["active"] else "reactivated"
+                if event != "unchanged":
+                    self._event(ad_id, comp, event, digest)
+                self.stats[event] += 1
+
+    def close_out(self, competitors):
+        """Mark ads not seen this run as ended, for advertisers whose ads were fully enumerated."""
+        with self._lock, self._db:
+            for comp in competitors:
+                self._db.execute(
+                    "INSERT INTO ad_events (ad_archive_id, competitor_name, event, at, content_hash) "
+                    "SELECT ad_archive_id, competitor_name, 'ended', ?, content_hash FROM ads "
+                    "WHERE competitor_name = ? AND active = 1 AND last_seen < ?",
+                    (self.run_at, comp, self.run_at),
+                )
+                cur = self._db.execute(
+                    "UPDATE ads SET active = 0, ended_at = ? WHERE competitor_name = ? AND active = 1 AND last_seen < ?",
+                    (self.run_at, comp, self.run_at),
+                )
+                self.stats["ended"] += cur.rowcount
+
+    def record_manual(self, row):
+        """Store manual Ad Library evidence; fills blank creative fields but never flips activity."""
+        ids = archive_ids(row.get("ad_id_or_archive_id", ""))
+        comp = row.get("competitor_name", "")
+        with self._lock, self._db:
+            for ad_id in ids:
+                values = [row.get(f, "") or "" for f in CREATIVE_FIELDS]
+                cur = self._db.execute("SELECT * FROM ads WHERE ad_archive_id = ?", (ad_id,)).fetchone()
+                if cur is None:
+                    digest = creative_hash(row)
+                    self._db.execute(
+                        "INSERT INTO ads (ad_archive_id, competitor_name, ad_library_url, " + ", ".join(CREATIVE_FIELDS)
+                        + ", content_hash, source, first_seen, last_seen) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'manual', ?, ?)",
+                        [ad_id, comp, row.get("ad_library_url", "")] + values + [digest, self.run_at, self.run_at],
+                    )
+                else:
+                    merged = {f: cur[f] or v for f, v in zip(CREATIVE_FIELDS, values)}
+                    digest = creative_hash(merged)
+                    if digest == cur["content_hash"]:
+                        continue
+                    self._db.execute(
+                        "UPDATE ads SET " + ", ".join(f"{f} = ?" for f in CREATIVE_FIELDS) + ", content_hash = ? WHERE ad_archive_id = ?",
+                        [merged[f] for f in CREATIVE_FIELDS] + [digest, ad_id],
+                    )
+                self._event(ad_id, comp, "manual", digest)
+                self.stats["manual"] += 1
+
+    def velocity(self, now=None):
+        """Per-competitor active count plus launches / endings over the last 7 and 30 days."""
+        now = dt.datetime.fromisoformat(now or self.run_at)
+        d7 = (now - dt.timedelta(days=7)).isoformat(timespec="seconds")
+        d30 = (now - dt.timedelta(days=30)).isoformat(timespec="seconds")
+        with self._lock:
+            rows = self._db.execute(
+                """
+                SELECT competitor_name,
+                       SUM(active) AS active_ads,
+                       SUM(first_seen >= :d7) AS launched_7d,
+                       SUM(ended_at != '' AND ended_at >= :d7) AS ended_7d,
+                       SUM(first_seen >= :d30) AS launched_30d,
+                       SUM(ended_at != '' AND ended_at >= :d30) AS ended_30d,
+                       MIN(first_seen) AS first_seen,
+                       MAX(last_seen) AS last_seen
+                FROM ads GROUP BY competitor_name ORDER BY competitor_name
+                """,
+                {"d7": d7, "d30": d30},
+            ).fetchall()
+        return [{k: str(r[k]) for k in VELOCITY_FIELDS} for r in rows]
+
+    def summary(self):
+        return ", ".join(f"{k}={v}" for k, v in self.stats.items())
+
+    def close(self):
+        with self._lock:
+            self._db.commit()
+            self._db.close()
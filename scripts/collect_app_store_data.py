@@ -14,6 +14,7 @@ import pandas as pd
 from pathlib import Path
 from datetime import datetime
 import io
+from http_cache import cached_get
 
 # Fix Windows encoding
 if sys.platform == 'win32':
@@ -61,7 +62,7 @@ def fetch_app_store_info(bundle_id):
     try:
         # iTunes Search API
         url = f"https://itunes.apple.com/hk/lookup?bundleId={bundle_id}"
-        response = requests.get(url, headers=HEADERS, timeout=10)
+        response = cached_get(url, headers=HEADERS, timeout=10, source='app_store')
 
         if response.status_code == 200:
             data = response.json()
@@ -15,6 +15,7 @@ from pathlib import Path
 from datetime import datetime
 from bs4 import BeautifulSoup
 import re
+from http_cache import cached_get
 
 # Fix Windows encoding
 if sys.platform == 'win32':
@@ -65,7 +66,7 @@ def extract_linkedin_company_data(url):
 
     try:
         print(f"  → Fetching {url}...")
-        response = requests.get(url, headers=headers, timeout=30)
+        response = cached_get(url, headers=headers, timeout=30, source='linkedin')
 
         if response.status_code == 200:
             soup = BeautifulSoup(response.text, 'html.parser')
@@ -14,6 +14,7 @@ import pandas as pd
 from pathlib import Path
 from datetime import datetime
 import io
+from http_cache import cached_get
 
 # Fix Windows encoding
 if sys.platform == 'win32':
@@ -126,8 +127,8 @@ def fetch_similarweb_data(domain, cookies_dict, competitors):
 
         try:
             # Desktop Traffic
-            response = requests.get(f"{similarweb_url}?tab=overview/overview/desktop",
-                                  headers=headers, timeout=30)
+            response = cached_get(f"{similarweb_url}?tab=overview/overview/desktop",
+                                  headers=headers, timeout=30, source='similarweb')
 
             if response.status_code == 200:
                 print(f"✓ 请求成功 (状态码: {response.status_code})")
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Near-duplicate clustering of ad copy with MinHash signatures and LSH banding.
+
+Each ad's ``primary_text`` + ``headline`` is lowercased, folded to Simplified Chinese and
+cut into character shingles. Signatures use one-permutation MinHash: every shingle is
+hashed once and kept as the minimum of one of ``num_perm`` bins, and empty bins borrow
+from the next filled bin (rotation densification), so a signature costs one pass over the
+shingles. Signatures are split into ``bands`` bands; an ad is only compared with ads that
+share one of its buckets within the same group (competitor), and pairs whose estimated
+Jaccard similarity reaches ``threshold`` are merged with union-find. Only bucket-mates are
+ever compared, never all pairs.
+"""
+
+import hashlib
+import operator
+import re
+import zlib
+
+from zh_segment import fold_zh
+
+NON_WORD_RE = re.compile(r"[\W_]+")
+MASK64 = (1 << 64) - 1
+GOLDEN64 = 0x9E3779B97F4A7C15
+EMPTY = 1 << 64
+
+
+def copy_text(row):
+    return " ".join([row.get("primary_text", "") or "", row.get("headline", "") or ""]).strip()
+
+
+def normalize(text):
+    return NON_WORD_RE.sub(" ", fold_zh(text or "").lower()).strip()
+
+
+class MinHasher:
+    def __init__(self, num_perm=64, shingle=3):
+        if num_perm < 2 or num_perm & (num_perm - 1):
+            raise ValueError("num_perm must be a power of two")
+        self.num_perm = num_perm
+        self.shingle = shingle
+        self._shift = 64 - (num_perm.bit_length() - 1)
+        self._value_mask = (1 << self._shift) - 1
+
+    def signature(self, norm):
+        """One-permutation MinHash signature of a normalized text; None for empty text."""
+        if not norm:
+            return None
+        data = norm.encode("utf-32-le")
+        width = 4 * self.shingle
+        n, shift, vmask = self.num_perm, self._shift, self._value_mask
+        sig = [EMPTY] * n
+        for x in {zlib.crc32(data[i:i + width]) for i in range(0, max(len(data) - width, 0) + 1, 4)}:
+            h = (x * GOLDEN64) & MASK64
+            b, v = h >> shift, h & vmask
+            if v < sig[b]:
+                sig[b] = v
+        if EMPTY in sig:
+            out, nxt = list(sig), None
+            for j in range(2 * n - 1, -1, -1):
+                if sig[j % n] != EMPTY:
+                    nxt = j
+                elif j < n:
+                    out[j] = sig[nxt % n] + ((nxt - j) << shift)
+            sig = out
+        return tuple(sig)
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(map(operator.eq, a, b)) / len(a)
+
+
+def cluster_near_duplicates(items, threshold=0.6, num_perm=64, bands=16, hasher=None):
+    """Cluster ids for (group, text) items; near-duplicates within one group share an id.
+
+    Clusters are the connected components of "shares an LSH bucket and has estimated
+    similarity >= threshold", so they do not depend on input order. Items with the same
+    normalized text (including empty text) always share a cluster. Ids are
+    ``sha1(group + smallest normalized text in the cluster)[:10]``, also order-independent.
+    """
+    hasher = hasher or MinHasher(num_perm)
+    rows = max(1, hasher.num_perm // bands)
+    # One node per distinct (group, normalized text); duplicates map onto it.
+    node_of, nodes, item_node = {}, [], []
+    for group, text in items:
+        key = (group, normalize(text))
+        if key not in node_of:
+            node_of[key] = len(nodes)
+            nodes.append(key)
+        item_node.append(node_of[key])
+    parent = list(range(len(nodes)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    sigs = [hasher.signature(norm) for _, norm in nodes]
+    # bucket -> {root: [members]}; members are grouped by component so an ad is checked against
+    # each other component in the bucket (stopping at the first similar member), not every member.
+    buckets = {}
+    for i, ((group, _), sig) in enumerate(zip(nodes, sigs)):
+        if sig is None:
+            continue
+        checked = set()  # a pair sharing several bands is compared once
+        for b in range(0, hasher.num_perm, rows):
+            comps = buckets.setdefault((group, b, sig[b:b + rows]), {})
+            if len(comps) > 1:
+                regrouped = {}
+                for r, members in comps.items():
+                    regrouped.setdefault(find(r), []).extend(members)
+                comps.clear()
+                comps.update(regrouped)
+            for r, members in list(comps.items()):
+                ri, rr = find(i), find(r)
+                if ri == rr:
+                    continue
+                for m in members:
+                    if m in checked:
+                        continue
+                    checked.add(m)
+                    if similarity(sig, sigs[m]) >= threshold:
+                        parent[max(ri, rr)] = min(ri, rr)
+                        break
+            comps.setdefault(find(i), []).append(i)
+    rep = {}
+    for i, (_, norm) in enumerate(nodes):
+        r = find(i)
+        if r not in rep or norm < rep[r]:
+            rep[r] = norm
+    ids = [hashlib.sha1(f"{group}\x1f{rep[find(i)]}".encode("utf-8")).hexdigest()[:10] for i, (group, _) in enumerate(nodes)]
+    return [ids[n] for n in item_node]
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared conditional-GET HTTP cache for the collectors.
+
+Bodies are stored content-addressed (sha256) under ``<root>/blobs``; ``<root>/index.json``
+maps each request (URL + params, plus a hash of any ``Cookie`` / ``Authorization`` header so
+a page fetched under one session is never replayed for another) to its ETag,
+Last-Modified, blob and fetch time. Within a source's TTL a request is served locally;
+after that it is revalidated with If-None-Match / If-Modified-Since and a 304 reuses the
+stored body. Total blob size is bounded with least-recently-used eviction.
+"""
+
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlencode
+
+try:
+    import requests
+except Exception:
+    requests = None
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent.parent / "output" / "http_cache"
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+# Seconds a stored response is served without contacting the origin, per source.
+DEFAULT_TTLS = {
+    "default": 6 * 3600,
+    "homepage": 24 * 3600,
+    "meta_ad_library": 3600,
+    "linkedin": 24 * 3600,
+    "similarweb": 12 * 3600,
+    "app_store": 6 * 3600,
+    # Semrush reports (source "semrush:<type>"); paid-keyword snapshots move slowly and cost units.
+    "semrush:domain_adwords": 7 * 24 * 3600,
+    "semrush:domain_adwords_adwords": 7 * 24 * 3600,
+    "semrush:domain_adwords_ads": 7 * 24 * 3600,
+    "semrush:domain_adwords_unique": 7 * 24 * 3600,
+}
+# Query parameters that must never reach the on-disk index.
+SECRET_PARAMS = {"key", "api_key", "apikey", "token", "access_token"}
+# Request headers that identify a session; they are hashed into the key, never stored.
+CREDENTIAL_HEADERS = ("cookie", "authorization")
+
+
+class CachedResponse:
+    """Minimal stand-in for requests.Response built from a cache entry."""
+
+    def __init__(self, url, status_code, content, headers, encoding, from_cache):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+        self.encoding = encoding
+        self.from_cache = from_cache  # "hit" | "revalidated" | "miss" | "uncached"
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.text)
+
+
+def credential_digest(headers=None):
+    """Hash of the session-identifying request headers ("" for anonymous requests)."""
+    creds = sorted((k.lower(), str(v)) for k, v in (headers or {}).items() if k.lower() in CREDENTIAL_HEADERS)
+    return hashlib.sha256(repr(creds).encode("utf-8")).hexdigest() if creds else ""
+
+
+def request_key(url, params=None, headers=None):
+    """Stable cache key for a GET request; secret params and credential headers are hashed but never stored."""
+    q = urlencode(sorted((params or {}).items()))
+    cred = credential_digest(headers)
+    return hashlib.sha256(f"GET {url}?{q}{' ' + cred if cred else ''}".encode("utf-8")).hexdigest()
+
+
+def display_url(url, params=None):
+    safe = {k: ("***" if k.lower() in SECRET_PARAMS else v) for k, v in (params or {}).items()}
+    return f"{url}?{urlencode(sorted(safe.items()))}" if safe else url
+
+
+class HttpCache:
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, ttls=None):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.stats = {"hit": 0, "revalidated": 0, "miss": 0, "uncached": 0, "evicted": 0}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.index = {}
+        try:
+            self.index = json.loads((self.root / "index.json").read_text(encoding="utf-8"))
+        except Exception:
+            self.index = {}
+
+    # --- low-level API (used by streaming callers) -------------------------------------
+
+    def prepare(self, url, params=None, source="default", headers=None):
+        """Return (key, entry or None, fresh, conditional request headers)."""
+        key = request_key(url, params, headers)
+        with self._lock:
+            entry = self.index.get(key)
+            if entry and not (self.root / "blobs" / entry["blob"][:2] / entry["blob"]).exists():
+                del self.index[key]
+                entry = None
+        if not entry:
+            return key, None, False, {}
+        ttl = self.ttls.get(source, self.ttls["default"])
+        fresh = time.time() - entry.get("fetched_at", 0) < ttl
+        cond = {}
+        if entry.get("etag"):
+            cond["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            cond["If-Modified-Since"] = entry["last_modified"]
+        return key, entry, fresh, cond
+
+    def record(self, outcome):
+        with self._lock:
+            self.stats[outcome] += 1
+
+    def read_body(self, entry):
+        with self._lock:
+            entry["last_access"] = time.time()
+            self._dirty = True
+        return (self.root / "blobs" / entry["blob"][:2] / entry["blob"]).read_bytes()
+
+    def touch(self, key, headers=None):
+        """Record a successful 304 revalidation."""
+        with self._lock:
+            entry = self.index.get(key)
+            if not entry:
+                return
+            entry["fetched_at"] = entry["last_access"] = time.time()
+            if headers:
+                entry["etag"] = headers.get("ETag") or entry.get("etag", "")
+                entry["last_modified"] = headers.get("Last-Modified") or entry.get("last_modified", "")
+            self._dirty = True
+
+    def store(self, key, url, headers, body, encoding="", source="default", partial=False):
+        digest = hashlib.sha256(body).hexdigest()
+        path = self.root / "blobs" / digest[:2] / digest
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_bytes(body)
+            os.replace(tmp, path)
+        now = time.time()
+        with self._lock:
+            self.index[key] = {
+                "url": url,
+                "source": source,
+                "blob": digest,
+                "size": len(body),
+                "etag": (headers or {}).get("ETag", ""),
+                "last_modified": (headers or {}).get("Last-Modified", ""),
+                "content_type": (headers or {}).get("Content-Type", ""),
+                "encoding": encoding or "",
+                "partial": partial,
+                "fetched_at": now,
+                "last_access": now,
+            }
+            self._dirty = True
+
+    # --- high-level drop-in for requests.get ------------------------------------------
+
+    def get(self, url, params=None, headers=None, timeout=30, source="default", session=None):
+        key, entry, fresh, cond = self.prepare(url, params, source, headers)
+        if entry and entry.get("partial"):
+            entry, fresh, cond = None, False, {}
+        if entry and fresh:
+            self.record("hit")
+            return CachedResponse(url, 200, self.read_body(entry), {"Content-Type": entry.get("content_type", "")}, entry.get("encoding"), "hit")
+        getter = session.get if session is not None else requests.get
+        resp = getter(url, params=params, headers={**(headers or {}), **cond}, timeout=timeout)
+        if resp.status_code == 304 and entry:
+            self.touch(key, resp.headers)
+            self.record("revalidated")
+            return CachedResponse(url, 200, self.read_body(entry), {"Content-Type": entry.get("content_type", "")}, entry.get("encoding"), "revalidated")
+        if resp.status_code != 200:
+            self.record("uncached")
+            return CachedResponse(url, resp.status_code, resp.content, dict(resp.headers), resp.encoding, "uncached")
+        encoding = resp.encoding or resp.apparent_encoding
+        self.store(key, display_url(url, params), resp.headers, resp.content, encoding, source)
+        self.record("miss")
+        return CachedResponse(url, 200, resp.content, dict(resp.headers), encoding, "miss")
+
+    # --- persistence / eviction -------------------------------------------------------
+
+    def evict(self):
+        """Drop least-recently-used entries until unique blob bytes fit max_bytes."""
+        with self._lock:
+            blob_size = {}
+            for e in self.index.values():
+                blob_size[e["blob"]] = e.get("size", 0)
+            total = sum(blob_size.values())
+            if total <= self.max_bytes:
+                return
+            refs = {}
+            for e in self.index.values():
+                refs[e["blob"]] = refs.get(e["blob"], 0) + 1
+            for key, e in sorted(self.index.items(), key=lambda kv: kv[1].get("last_access", 0)):
+                if total <= self.max_bytes:
+                    break
+                del self.index[key]
+                self.stats["evicted"] += 1
+                refs[e["blob"]] -= 1
+                if refs[e["blob"]] == 0:
+                    total -= blob_size[e["blob"]]
+                    try:
+                        (self.root / "blobs" / e["blob"][:2] / e["blob"]).unlink()
+                    except OSError:
+                        pass
+            self._dirty = True
+
+    def save(self):
+        self.evict()
+        with self._lock:
+            if not self._dirty:
+                return
+            self.root.mkdir(parents=True, exist_ok=True)
+            tmp = self.root / f"index.json.{os.getpid()}.tmp"
+            tmp.write_text(json.dumps(self.index, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, self.root / "index.json")
+            self._dirty = False
+
+    def summary(self):
+        return ", ".join(f"{k}={v}" for k, v in self.stats.items())
+
+
+_default = None
+
+
+def default_cache():
+    """Process-wide cache for the standalone collectors; saved at interpreter exit.
+
+    Set HKPOS_HTTP_CACHE=off to bypass it.
+    """
+    global _default
+    if os.getenv("HKPOS_HTTP_CACHE", "").lower() in {"off", "0", "false"}:
+        return None
+    if _default is None:
+        _default = HttpCache()
+        atexit.register(_default.save)
+    return _default
+
+
+def cached_get(url, params=None, headers=None, timeout=30, source="default"):
+    """requests.get replacement for the collectors, routed through the shared cache."""
+    cache = default_cache()
+    if cache is None:
+        return requests.get(url, params=params, headers=headers, timeout=timeout)
+    return cache.get(url, params=params, headers=headers, timeout=timeout, source=source)
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for the Meta Ad Library that replays recorded pages.
+
+Pages saved by ``run_all.py --meta-record-dir <dir>`` are laid out as
+``<dir>/<q>/first.txt`` plus one ``<dir>/<q>/<forward_cursor>.txt`` per continuation page.
+This server answers ``/ads/library/?...&q=<q>[&forward_cursor=<cursor>]`` from that
+layout so the paginated harvester can be exercised offline:
+
+    python scripts/replay_ad_library.py --dir output/ad_library_pages --port 8799
+    python scripts/run_all.py --meta-ad-library-url http://127.0.0.1:8799/ads/library/
+"""
+
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+from run_all import ad_page_record_path
+
+
+def make_handler(record_dir):
+    class ReplayHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            cursor = (parse_qs(parsed.query).get("forward_cursor") or [""])[0]
+            page = ad_page_record_path(record_dir, self.path, cursor)
+            if not page.exists():
+                self.send_error(404, f"no recorded page: {page.relative_to(record_dir)}")
+                return
+            body = page.read_bytes()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):
+            print(f"[replay] {self.address_string()} {fmt % args}")
+
+    return ReplayHandler
+
+
+def main():
+    p = argparse.ArgumentParser(description="Replay recorded Meta Ad Library pages")
+    p.add_argument("--dir", required=True, help="Directory written by run_all.py --meta-record-dir")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8799)
+    a = p.parse_args()
+    record_dir = Path(a.dir).resolve()
+    server = ThreadingHTTPServer((a.host, a.port), make_handler(record_dir))
+    print(f"Replaying {record_dir} on http://{a.host}:{a.port}/ads/library/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
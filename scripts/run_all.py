@@ -2,29 +2,64 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
-import argparse, csv, datetime as dt, html, io, json, os, re, sys, zipfile
-from collections import Counter, defaultdict
+import argparse, asyncio, codecs, csv, datetime as dt, hashlib, html, io, json, mmap, os, random, re, sys, threading, time, zipfile
+from array import array
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
 from dataclasses import dataclass
-from pathlib import Path
-from typing import Dict, List, Sequence, Tuple
-from urllib.parse import quote_plus, urlparse
+from pathlib import Path, PurePosixPath
+from typing import Dict, Iterable, List, Sequence, Tuple
+from urllib.parse import parse_qs, quote_plus, urlparse
 
 try:
     import requests
+    import requests.adapters
 except Exception:
     requests = None
 try:
     import openpyxl
 except Exception:
     openpyxl = None
+try:
+    from playwright.async_api import async_playwright
+except Exception:
+    async_playwright = None
+
+from ad_store import VELOCITY_FIELDS, AdStore
+from copy_clusters import cluster_near_duplicates, copy_text
+from http_cache import HttpCache, display_url
+from semrush_history import SemrushHistoryStore, display_date, recent_months
+from zh_segment import default_segmenter, fold_zh
 
 KEYWORD_HINTS={"competitor","competitors","pos","hong kong","hk","domain","website","facebook","page","instagram","ig","ads","广告","投放"}
+HINT_TEXT_RE=re.compile("|".join(re.escape(k) for k in sorted(KEYWORD_HINTS)),re.I)
+# Hint keywords as raw UTF-8 and GBK bytes: files without any of them are rejected before decoding.
+HINT_BYTES_RE=re.compile(b"|".join(sorted({re.escape(k.encode(enc)) for k in KEYWORD_HINTS for enc in ("utf-8","gbk")})),re.I)
+ENCODING_SAMPLE_BYTES=64*1024
+MMAP_THRESHOLD_BYTES=4*1024*1024
 SCAN_EXTENSIONS={".csv",".md",".json",".html",".txt",".xlsx"}
+# Bump when extractor code changes; hints, patterns and openpyxl availability are hashed into the key (scan_cache_key).
+SCAN_CACHE_VERSION=2
+# Bump when infer_objective_and_destination / infer_format_hint / classify_proposition_tags logic changes.
+COPY_RULES_VERSION=1
+COPY_MEMO_MAX_AGE_SEC=30*24*3600
+AD_LIBRARY_BASE_URL="https://www.facebook.com/ads/library/"
+# Tail kept between chunks for a link prefix that does not match yet ("https://www.instagram.com/" is 26 chars);
+# a match running into the chunk end is carried from its start whatever its length.
+SOCIAL_SCAN_OVERLAP_CHARS=64
+RENDER_BLOCKED_RESOURCES={"image","media","font"}
+RENDER_CAPTURED_RESOURCES={"document","xhr","fetch"}
+RENDER_USER_AGENT="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/130.0.0.0 Safari/537.36"
+SCAN_IGNORE_DEFAULTS=["/output/scan_cache.json*"]
 COMPETITOR_FIELDS=["competitor_name","website_domain","website_url","facebook_page_url","instagram_handle","notes_source_file","confidence","missing_page_url"]
 META_FIELDS=["competitor_name","advertiser_name","facebook_page_url","ad_library_url","ad_count_active","ad_id_or_archive_id","status","platforms_hint","ad_format_hint","objective_path_hint","objective_reason","message_destination_hint","landing_page_url","primary_text","headline","call_to_action","captured_at","collection_method","error_reason","manual_required_fields","manual_instructions"]
+META_CARD_FIELDS=["competitor_name","ad_library_url","ad_archive_id","start_date","primary_text","headline","call_to_action","landing_page_url","captured_at"]
+META_KEYWORD_FIELDS=["row_type","competitor_name","ad_id_or_archive_id","ad_library_url","label_primary","label_secondary","label_reason","count","cluster_id"]
 SEMRUSH_FIELDS=["competitor_name","website_domain","paid_keywords_top","paid_keywords_count","sample_ad_copies","database","units_before","units_after","captured_at"]
 EN_STOPWORDS={"the","and","for","with","your","you","from","that","this","are","our","can","now","get","pos","hong","kong"}
 ZH_STOPWORDS={"的","了","和","及","與","为","是","在","可","更","你","您"}
+ZH_STOPWORDS_FOLDED={fold_zh(w) for w in ZH_STOPWORDS}
 
 CORE_COMPETITORS = [
     {"competitor_name":"Eats365","website_domain":"eats365pos.com","website_url":"https://www.eats365pos.com/hk/"},
@@ -61,6 +96,26 @@ class StepLogger:
         self.path.write_text(body,encoding="utf-8")
         self.latest.write_text(body,encoding="utf-8")
 
+# A scan source file that lives inside a zip archive; read straight from the archive, never extracted.
+@dataclass(frozen=True)
+class ZipMember:
+    zip_path:Path
+    name:str
+    file_size:int
+    crc:int
+    @property
+    def suffix(self)->str:return PurePosixPath(self.name).suffix
+    def __str__(self)->str:return f"{self.zip_path}!{self.name}"
+    def open(self):return zip_handle(self.zip_path).open(self.name)
+    def read_bytes(self)->bytes:return zip_handle(self.zip_path).read(self.name)
+
+_ZIP_HANDLES:Dict[Tuple[int,str],zipfile.ZipFile]={}
+def zip_handle(zip_path:Path)->zipfile.ZipFile:
+    # One open archive per process; keyed by pid so forked scan workers never share a file offset.
+    key=(os.getpid(),str(zip_path))
+    if key not in _ZIP_HANDLES:_ZIP_HANDLES[key]=zipfile.ZipFile(zip_path,"r")
+    return _ZIP_HANDLES[key]
+
 def sanitize_text(s:str)->str:
     if not s:return s
     s=re.sub(r"([?&]key=)[^&\s]+",r"\1***",s,flags=re.I)
@@ -102,9 +157,55 @@ def confidence_level(r:Dict[str,str])->str:
     if (has_name and has_domain) or (has_name and has_fb):return "medium"
     return "low"
 
-def dedupe_competitors(rows:Sequence[Dict[str,str]])->List[Dict[str,str]]:
-    score={"low":1,"medium":2,"high":3};merged={};sources=defaultdict(set)
-    for row in rows:
+# Aho-Corasick automaton: every occurrence of every pattern in one pass over the text.
+class TokenAutomaton:
+    def __init__(self,patterns:Sequence[str])->None:
+        self.patterns=list(patterns);self.goto=[{}];self.fail=[0];self.out=[[]]
+        for idx,pat in enumerate(self.patterns):
+            node=0
+            for ch in pat:
+                nxt=self.goto[node].get(ch)
+                if nxt is None:
+                    nxt=len(self.goto);self.goto[node][ch]=nxt;self.goto.append({});self.fail.append(0);self.out.append([])
+                node=nxt
+            if pat:self.out[node].append(idx)
+        queue=deque(self.goto[0].values())
+        while queue:
+            node=queue.popleft()
+            for ch,nxt in self.goto[node].items():
+                queue.append(nxt);f=self.fail[node]
+                while f and ch not in self.goto[f]:f=self.fail[f]
+                f=self.goto[f].get(ch,0);self.fail[nxt]=f if f!=nxt else 0
+                self.out[nxt]=self.out[nxt]+self.out[self.fail[nxt]]
+    def iter_hits(self,text:str):
+        node=0
+        for i,ch in enumerate(text):
+            while node and ch not in self.goto[node]:node=self.fail[node]
+            node=self.goto[node].get(ch,0)
+            for idx in self.out[node]:yield i,idx
+    def hit_set(self,text:str)->set:
+        return {idx for _,idx in self.iter_hits(text)}
+
+CORE_TOKENS:Dict[str,Dict[str,str]]={}
+for _c in CORE_COMPETITORS:
+    CORE_TOKENS.setdefault(_c["competitor_name"].lower(),_c)
+    CORE_TOKENS.setdefault(normalize_domain(_c["website_domain"]).split(".")[0],_c)
+CORE_TOKEN_LIST=list(CORE_TOKENS)
+CORE_MATCHER=TokenAutomaton(CORE_TOKEN_LIST)
+
+def match_core_competitor(text:str)->Dict[str,str]|None:
+    # Earliest-declared core token wins, same as scanning CORE_COMPETITORS in order.
+    hits=CORE_MATCHER.hit_set(text.lower())
+    return CORE_TOKENS[CORE_TOKEN_LIST[min(hits)]] if hits else None
+
+# In-memory competitor table: rows are upserted once, merged by confidence, and looked up through
+# a domain/name-keyed index and a name index instead of re-deduping the full list at every stage.
+class CompetitorRegistry:
+    SCORE={"low":1,"medium":2,"high":3}
+    def __init__(self)->None:
+        self.records:Dict[str,Dict[str,str]]={};self.sources:Dict[str,set]=defaultdict(set);self.by_name:Dict[str,str]={}
+    def __len__(self)->int:return len(self.records)
+    def upsert(self,row:Dict[str,str])->str:
         r={k:(row.get(k,"") or "").strip() for k in COMPETITOR_FIELDS}
         r["website_domain"]=normalize_domain(r["website_domain"] or r["website_url"])
         r["website_url"]=normalize_website_url(r["website_url"] or r["website_domain"])
@@ -113,29 +214,98 @@ def dedupe_competitors(rows:Sequence[Dict[str,str]])->List[Dict[str,str]]:
         r["confidence"]=r["confidence"] or confidence_level(r)
         r["missing_page_url"]="true" if not r["facebook_page_url"] else "false"
         key=(r["website_domain"] or r["competitor_name"]).lower().strip()
-        if not key:continue
-        sources[key].add(r.get("notes_source_file",""))
-        if key not in merged:merged[key]=r;continue
-        cur=merged[key];best=r if score.get(r["confidence"],1)>score.get(cur["confidence"],1) else cur;other=cur if best is r else r
+        if not key:return ""
+        self.sources[key].add(r.get("notes_source_file",""))
+        cur=self.records.get(key)
+        if cur is None:
+            self.records[key]=r;self.by_name.setdefault(r["competitor_name"].lower(),key);return key
+        best=r if self.SCORE.get(r["confidence"],1)>self.SCORE.get(cur["confidence"],1) else cur;other=cur if best is r else r
         for f in COMPETITOR_FIELDS:
             if f!="notes_source_file" and not best.get(f) and other.get(f):best[f]=other[f]
-        best["confidence"]=confidence_level(best);best["missing_page_url"]="true" if not best.get("facebook_page_url") else "false";merged[key]=best
-    out=[]
-    for k,r in merged.items():r["notes_source_file"]=";".join(sorted(x for x in sources[k] if x));out.append(r)
-    out.sort(key=lambda x:(x.get("competitor_name","").lower(),x.get("website_domain","")))
-    return out
+        best["confidence"]=confidence_level(best);best["missing_page_url"]="true" if not best.get("facebook_page_url") else "false"
+        self.records[key]=best;self.by_name.setdefault(best["competitor_name"].lower(),key)
+        return key
+    def upsert_many(self,rows:Sequence[Dict[str,str]])->None:
+        for r in rows:self.upsert(r)
+    def get(self,domain_or_name:str)->Dict[str,str]|None:
+        v=(domain_or_name or "").strip().lower()
+        key=normalize_domain(v) if "." in v else v
+        if key in self.records:return self.records[key]
+        key=self.by_name.get(v)
+        return self.records.get(key) if key else None
+    def retain(self,pred)->None:
+        for k in [k for k,r in self.records.items() if not pred(r)]:
+            del self.records[k];self.sources.pop(k,None)
+        self.by_name={n:k for n,k in self.by_name.items() if k in self.records}
+    def rows(self)->List[Dict[str,str]]:
+        # Live records (not copies): later stages enrich them in place.
+        out=[]
+        for k,r in self.records.items():r["notes_source_file"]=";".join(sorted(x for x in self.sources[k] if x));out.append(r)
+        out.sort(key=lambda x:(x.get("competitor_name","").lower(),x.get("website_domain","")))
+        return out
+    def clear(self)->None:
+        self.records.clear();self.sources.clear();self.by_name.clear()
+    def canonicalize(self)->None:
+        # Snap rows onto CORE_COMPETITORS identities (re-keying merges duplicates) and seed missing cores.
+        rows=self.rows();self.clear()
+        for r in rows:
+            patch=match_core_competitor(r.get("competitor_name","")+r.get("website_domain",""))
+            if patch:
+                for pk in ("competitor_name","website_domain","website_url"):r[pk]=patch[pk]
+            r["confidence"]=confidence_level(r)
+            self.upsert(r)
+        for c in CORE_COMPETITORS:
+            dom=normalize_domain(c["website_domain"])
+            if dom in self.records:continue
+            self.upsert({"competitor_name":c["competitor_name"],"website_domain":dom,"website_url":c["website_url"],"facebook_page_url":"","instagram_handle":"","notes_source_file":"seed_core","confidence":"medium","missing_page_url":"true"})
+    def refresh(self)->None:
+        # Recompute derived fields after in-place enrichment; keys are unchanged so no re-merge is needed.
+        for r in self.records.values():
+            r["confidence"]=confidence_level(r);r["missing_page_url"]="true" if not r.get("facebook_page_url") else "false"
+
+def dedupe_competitors(rows:Sequence[Dict[str,str]])->List[Dict[str,str]]:
+    reg=CompetitorRegistry();reg.upsert_many(rows);return reg.rows()
+
+def sniff_encoding(sample:bytes)->str:
+    if sample.startswith(codecs.BOM_UTF8):return "utf-8-sig"
+    for enc in ("utf-8","cp936","gb18030"):
+        # Incremental decode so a multi-byte char cut at the sample edge is not a failure.
+        try:codecs.getincrementaldecoder(enc)().decode(sample,final=False);return enc
+        except UnicodeDecodeError:pass
+    return "latin-1"
 
-def read_text_file(path:Path)->str:
-    for enc in ("utf-8","utf-8-sig","cp936","gb18030","latin-1"):
-        try:return path.read_text(encoding=enc)
-        except Exception:pass
-    return ""
+def decode_text_bytes(buf)->str:
+    enc=sniff_encoding(bytes(buf[:ENCODING_SAMPLE_BYTES]))
+    for e in dict.fromkeys((enc,"utf-8","cp936","gb18030","latin-1")):
+        try:t=str(buf,e);break
+        except UnicodeDecodeError:pass
+    # Match text-mode reads (universal newlines) so downstream parsing is unchanged.
+    return t.replace("\r\n","\n").replace("\r","\n")
+
+def read_text_file(path:Path|ZipMember,require_hints:bool=False)->str:
+    # One read as bytes (memory-mapped for big files), optional byte-level hint prefilter, one decode.
+    if isinstance(path,ZipMember):
+        buf=path.read_bytes()
+        if not buf or (require_hints and not HINT_BYTES_RE.search(buf)):return ""
+        return decode_text_bytes(buf)
+    with path.open("rb") as f:
+        size=os.fstat(f.fileno()).st_size
+        if not size:return ""
+        if size<MMAP_THRESHOLD_BYTES:
+            buf=f.read()
+            if require_hints and not HINT_BYTES_RE.search(buf):return ""
+            return decode_text_bytes(buf)
+        with mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ) as mm:
+            if require_hints and not HINT_BYTES_RE.search(mm):return ""
+            with memoryview(mm) as mv:return decode_text_bytes(mv)
 
 def row_text_has_hints(t:str)->bool:
-    t=(t or "").lower();return any(k in t for k in KEYWORD_HINTS)
+    return bool(t) and HINT_TEXT_RE.search(t) is not None
+
+DOMAIN_RE=re.compile(r"\b(?:[a-zA-Z0-9-]+\.)+[a-zA-Z]{2,}\b")
 
 def extract_domains(text:str)->List[str]:
-    found=re.findall(r"\b(?:[a-zA-Z0-9-]+\.)+[a-zA-Z]{2,}\b",text or "")
+    found=DOMAIN_RE.findall(text or "")
     out=[]
     for d in found:
         d=d.lower().strip(".")
@@ -160,11 +330,16 @@ def is_valid_competitor_row(r:Dict[str,str])->bool:
     allow=("eats365","ezpos","roka","omniwe","ichef","dimpos","hctc","caterlord","dola","loyverse","gingersoft","clggroup","eposhk","favourpos","food")
     return any(k in d for k in allow) or any(k in n for k in allow)
 
-def extract_facebook_urls(text:str)->List[str]:return re.findall(r"https?://(?:www\.)?facebook\.com/[A-Za-z0-9_.\-/]+",text or "",flags=re.I)
-def extract_instagram_handles(text:str)->List[str]:
-    urls=re.findall(r"https?://(?:www\.)?instagram\.com/[A-Za-z0-9_.\-/]+",text or "",flags=re.I)
+FB_URL_RE=re.compile(r"https?://(?:www\.)?facebook\.com/[A-Za-z0-9_.\-/]+",re.I)
+# A bare page URL (one path segment) that is not a Facebook system path.
+FB_PAGE_SLUG_RE=re.compile(r"https?://(?:www\.)?facebook\.com/([A-Za-z0-9_.\-]+)/?$",re.I)
+FB_RESERVED_SLUGS={"tr","login","home.php","profile.php","pages","groups","events","watch","people","sharer.php","share.php"}
+IG_URL_RE=re.compile(r"https?://(?:www\.)?instagram\.com/[A-Za-z0-9_.\-/]+",re.I)
+def extract_facebook_urls(text:str)->List[str]:return FB_URL_RE.findall(text or "")
+def instagram_handles_from_urls(urls:Sequence[str])->List[str]:
     hs=[normalize_ig_handle(u) for u in urls]
     return [h for h in hs if h and h.lower() not in {"facebook","instagram"}]
+def extract_instagram_handles(text:str)->List[str]:return instagram_handles_from_urls(IG_URL_RE.findall(text or ""))
 
 def pick_best_facebook_url(urls:List[str])->str:
     cleaned=[]
@@ -189,8 +364,12 @@ def is_invalid_facebook_url(url:str)->bool:
         return True
     return False
 
+def is_facebook_page_slug(url:str)->bool:
+    m=FB_PAGE_SLUG_RE.match(url or "")
+    return bool(m) and not is_invalid_facebook_url(url) and m.group(1).lower() not in FB_RESERVED_SLUGS
+
 def extract_from_csv(path:Path)->List[Dict[str,str]]:
-    data=read_text_file(path)
+    data=read_text_file(path,require_hints=True)
     if not data.strip():return []
     try:reader=csv.DictReader(io.StringIO(data))
     except Exception:return []
@@ -207,7 +386,7 @@ def extract_from_csv(path:Path)->List[Dict[str,str]]:
     return rows
 def extract_from_xlsx(path:Path)->List[Dict[str,str]]:
     if openpyxl is None:return []
-    try:wb=openpyxl.load_workbook(path,read_only=True,data_only=True)
+    try:wb=openpyxl.load_workbook(io.BytesIO(path.read_bytes()) if isinstance(path,ZipMember) else path,read_only=True,data_only=True)
     except Exception:return []
     rows=[]
     for ws in wb.worksheets:
@@ -230,56 +409,324 @@ def extract_from_xlsx(path:Path)->List[Dict[str,str]]:
     return rows
 
 def extract_from_text_like(path:Path)->List[Dict[str,str]]:
-    t=read_text_file(path)
+    t=read_text_file(path,require_hints=True)
     if not t or not row_text_has_hints(t):return []
     domains,fb_urls,ig_handles=extract_domains(t),extract_facebook_urls(t),extract_instagram_handles(t)
     default_fb=fb_urls[0] if fb_urls else "";default_ig=ig_handles[0] if ig_handles else ""
     return [{"competitor_name":infer_name(d,"",""),"website_domain":normalize_domain(d),"website_url":normalize_website_url(d),"facebook_page_url":default_fb,"instagram_handle":default_ig,"notes_source_file":str(path),"confidence":"","missing_page_url":""} for d in domains]
 
-def extract_competitors_from_sources(scan_root:Path,logger:StepLogger)->List[Dict[str,str]]:
-    raw=[];scanned=0
-    skip_dir_tokens={"node_modules",".git","__pycache__","component_crx_cache","input"}
+def extract_file_rows(p:Path)->List[Dict[str,str]]:
+    ext=p.suffix.lower()
+    if ext==".csv":return extract_from_csv(p)
+    if ext==".xlsx":return extract_from_xlsx(p)
+    return extract_from_text_like(p)
+
+def extract_file_rows_safe(p:Path)->Tuple[List[Dict[str,str]],str]:
+    # Top-level so it can be pickled into scan worker processes.
+    try:return extract_file_rows(p),""
+    except Exception as exc:return [],str(exc)
+
+def file_content_hash(path:Path)->str:
+    h=hashlib.sha1()
+    with path.open("rb") as f:
+        for chunk in iter(lambda:f.read(1<<20),b""):h.update(chunk)
+    return h.hexdigest()
+
+def scan_cache_key()->str:
+    # Cached rows are only valid for the extractor settings that produced them: an xlsx cached as []
+    # without openpyxl, or rows filtered by older hints/patterns, must be re-extracted.
+    parts=[str(SCAN_CACHE_VERSION),"\x1e".join(sorted(KEYWORD_HINTS)),"openpyxl="+(getattr(openpyxl,"__version__","?") if openpyxl is not None else "missing"),",".join(sorted(SCAN_EXTENSIONS))]
+    parts+=[f"{r.pattern!s}/{r.flags}" for r in (HINT_TEXT_RE,HINT_BYTES_RE,DOMAIN_RE,FB_URL_RE,IG_URL_RE)]
+    return f"{SCAN_CACHE_VERSION}:"+hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()[:16]
+
+# Persistent per-file extraction cache keyed by path, size, mtime and content hash, under scan_cache_key().
+class ScanCache:
+    def __init__(self,path:Path)->None:
+        self.path=path;self.version=scan_cache_key();self.entries={};self.seen=set();self._pending={};self.hits=0;self.misses=0;self.invalidated=0
+        try:
+            data=json.loads(path.read_text(encoding="utf-8"))
+            if data.get("version")==self.version:self.entries=data.get("files",{})
+        except Exception:
+            self.entries={}
+    def get(self,p:Path|ZipMember)->List[Dict[str,str]]|None:
+        key=str(p);self.seen.add(key);e=self.entries.get(key)
+        if isinstance(p,ZipMember):
+            # The archive's central directory already carries size + CRC-32, so no content read is needed.
+            size,mtime_ns,digest=p.file_size,0,f"crc32:{p.crc:08x}"
+            if e and e.get("size")==size and e.get("digest")==digest:self.hits+=1;return e.get("rows",[])
+        else:
+            st=p.stat();size,mtime_ns=st.st_size,st.st_mtime_ns
+            if e and e.get("size")==size and e.get("mtime_ns")==mtime_ns:
+                self.hits+=1;return e.get("rows",[])
+            digest="sha1:"+file_content_hash(p)
+            if e and e.get("digest")==digest:
+                # Touched but unchanged content (e.g. checkout/copy): refresh stat fields only.
+                e["size"]=size;e["mtime_ns"]=mtime_ns;self.hits+=1;return e.get("rows",[])
+        if e:self.invalidated+=1
+        else:self.misses+=1
+        self._pending[key]={"size":size,"mtime_ns":mtime_ns,"digest":digest}
+        return None
+    def put(self,p:Path|ZipMember,rows:List[Dict[str,str]])->None:
+        meta=self._pending.pop(str(p),None)
+        if meta is not None:self.entries[str(p)]={**meta,"rows":rows}
+    def save(self,logger:StepLogger)->None:
+        stale=[k for k in self.entries if k not in self.seen]
+        for k in stale:del self.entries[k]
+        logger.log(f"Scan cache: hits={self.hits}, misses={self.misses}, invalidated={self.invalidated}, pruned={len(stale)}, path={self.path}")
+        try:
+            self.path.parent.mkdir(parents=True,exist_ok=True)
+            tmp=self.path.with_suffix(self.path.suffix+".tmp")
+            tmp.write_text(json.dumps({"version":self.version,"files":self.entries},ensure_ascii=False),encoding="utf-8")
+            os.replace(tmp,self.path)
+        except OSError as exc:
+            logger.log(f"WARN scan cache not saved: {exc}")
+
+def glob_to_regex(pat:str)->str:
+    out=[];i=0
+    while i<len(pat):
+        c=pat[i]
+        if pat.startswith("**/",i):out.append("(?:.*/)?");i+=3;continue
+        if pat.startswith("**",i):out.append(".*");i+=2;continue
+        if c=="*":out.append("[^/]*")
+        elif c=="?":out.append("[^/]")
+        elif c=="[":
+            j=pat.find("]",i+1)
+            if j<0:out.append(re.escape(c))
+            else:out.append("["+pat[i+1:j].replace("!","^",1)+"]");i=j
+        else:out.append(re.escape(c))
+        i+=1
+    return "".join(out)
+
+# Gitignore-style rules: "#" comments, "!" negation, trailing "/" = directories only,
+# a "/" anywhere else anchors the glob to the scan root; the last matching rule wins.
+class ScanIgnore:
+    def __init__(self,lines:Sequence[str])->None:
+        self.rules=[]
+        for ln in lines:
+            ln=ln.strip()
+            if not ln or ln.startswith("#"):continue
+            neg=ln.startswith("!");ln=ln[1:] if neg else ln
+            dir_only=ln.endswith("/");ln=ln.rstrip("/")
+            if not ln:continue
+            anchored="/" in ln;ln=ln.lstrip("/")
+            rx=("^" if anchored else "(?:^|.*/)")+glob_to_regex(ln)+"$"
+            self.rules.append((re.compile(rx,re.I),neg,dir_only))
+    @classmethod
+    def load(cls,path:Path|None)->"ScanIgnore":
+        lines=list(SCAN_IGNORE_DEFAULTS)
+        if path is not None and path.exists():lines.extend(read_text_file(path).splitlines())
+        return cls(lines)
+    def ignored(self,rel:str,is_dir:bool)->bool:
+        hit=False
+        for rx,neg,dir_only in self.rules:
+            if dir_only and not is_dir:continue
+            if rx.match(rel):hit=not neg
+        return hit
+
+def looks_binary(path:Path|ZipMember)->bool:
+    with path.open() if isinstance(path,ZipMember) else path.open("rb") as f:return b"\x00" in f.read(8192)
+
+SKIP_DIR_TOKENS={"node_modules",".git","__pycache__","component_crx_cache","input"}
+
+def scan_skip_reason(p:Path|ZipMember,rel:str,size:int,ignore:ScanIgnore,max_bytes:int)->str:
+    if p.suffix.lower() not in SCAN_EXTENSIONS:return "ext"
+    if ignore.ignored(rel,False):return "ignored"
+    if max_bytes and size>max_bytes:return "too_large"
+    try:return "binary" if p.suffix.lower()!=".xlsx" and looks_binary(p) else ""
+    except OSError:return "unreadable"
+
+def record_scan_file(summary:Dict[str,Counter],top:str,size:int,reason:str)->bool:
+    st=summary[top]
+    if reason:st["skipped_files"]+=1;st["skipped_bytes"]+=size;st[f"skip_{reason}"]+=1;return False
+    st["scanned_files"]+=1;st["scanned_bytes"]+=size;return True
+
+def iter_scan_files(scan_root:Path,ignore:ScanIgnore|None=None,max_bytes:int=0,summary:Dict[str,Counter]|None=None):
+    ignore=ignore or ScanIgnore([]);summary=summary if summary is not None else defaultdict(Counter)
+    if scan_root.is_file() and zipfile.is_zipfile(scan_root):
+        yield from iter_zip_members(scan_root,ignore,max_bytes,summary);return
     for root,dirs,files in os.walk(scan_root, topdown=True):
-        root_str=str(root).lower()
-        dirs[:] = [d for d in dirs if d.lower() not in skip_dir_tokens and "extracted_hk_pos_competitive_analysis" not in (root_str + "\\" + d.lower())]
-        if "input\\extracted_hk_pos_competitive_analysis\\hk-pos-competitive-analysis\\input\\extracted_hk_pos_competitive_analysis" in root_str:
-            continue
+        rel_root=Path(root).relative_to(scan_root).as_posix();rel_root="" if rel_root=="." else rel_root+"/"
+        top=rel_root.split("/")[0] or "."
+        kept=[]
+        for d in dirs:
+            if d.lower() in SKIP_DIR_TOKENS or ignore.ignored(rel_root+d,True):
+                summary[top if rel_root else d]["pruned_dirs"]+=1
+            else:kept.append(d)
+        dirs[:]=kept
         for fn in files:
-            try:
-                p=Path(root) / fn
-                if p.suffix.lower() not in SCAN_EXTENSIONS:
-                    continue
-                scanned+=1
-                if p.suffix.lower()==".csv":raw.extend(extract_from_csv(p))
-                elif p.suffix.lower()==".xlsx":raw.extend(extract_from_xlsx(p))
-                else:raw.extend(extract_from_text_like(p))
-            except Exception as exc:
-                logger.log(f"WARN extract failed: {Path(root) / fn} -> {exc}")
-    for c in CORE_COMPETITORS:
-        raw.append({"competitor_name":c["competitor_name"],"website_domain":c["website_domain"],"website_url":c["website_url"],"facebook_page_url":"","instagram_handle":"","notes_source_file":"seed_core","confidence":"low","missing_page_url":"true"})
-    out=[x for x in dedupe_competitors(raw) if is_valid_competitor_row(x)]
-    logger.log(f"Scanned {scanned} files, extracted {len(raw)} rows, filtered/deduped to {len(out)} competitors")
+            p=Path(root) / fn
+            try:size=p.stat().st_size
+            except OSError:size=0
+            if record_scan_file(summary,top,size,scan_skip_reason(p,rel_root+fn,size,ignore,max_bytes)):yield p
+
+def iter_zip_members(zip_path:Path,ignore:ScanIgnore,max_bytes:int,summary:Dict[str,Counter]):
+    # Same filters as the disk walk, driven by member name, size and CRC from the central directory.
+    pruned=set();seen_content=set();infos=[i for i in zip_handle(zip_path).infolist() if not i.is_dir()]
+    # Archives usually wrap everything in one root folder; summarise by the level below it.
+    depth=1 if infos and len({i.filename.split("/")[0] for i in infos})==1 and all("/" in i.filename for i in infos) else 0
+    for info in infos:
+        parts=info.filename.split("/");top=parts[depth] if len(parts)>depth+1 else "."
+        prefix=""
+        for d in parts[:-1]:
+            prefix+=d
+            if d.lower() in SKIP_DIR_TOKENS or ignore.ignored(prefix,True):
+                if prefix not in pruned:pruned.add(prefix);summary[top]["pruned_dirs"]+=1
+                break
+            prefix+="/"
+        else:
+            m=ZipMember(zip_path,info.filename,info.file_size,info.CRC)
+            reason=scan_skip_reason(m,info.filename,info.file_size,ignore,max_bytes)
+            if not reason and (info.filename,info.CRC) in seen_content:reason="duplicate"
+            seen_content.add((info.filename,info.CRC))
+            if record_scan_file(summary,top,info.file_size,reason):yield m
+
+def log_scan_summary(summary:Dict[str,Counter],logger:StepLogger)->None:
+    for d,st in sorted(summary.items(),key=lambda x:(-(x[1]["scanned_bytes"]+x[1]["skipped_bytes"]),x[0])):
+        reasons=", ".join(f"{k[5:]}={v}" for k,v in sorted(st.items()) if k.startswith("skip_"))
+        logger.log(f"Scan dir {d}: scanned files={st['scanned_files']} bytes={st['scanned_bytes']}, skipped files={st['skipped_files']} bytes={st['skipped_bytes']}"+(f" ({reasons})" if reasons else "")+(f", pruned_dirs={st['pruned_dirs']}" if st["pruned_dirs"] else ""))
+
+def run_extraction(paths:Sequence[Path],workers:int,logger:StepLogger)->List[Tuple[List[Dict[str,str]],str]]:
+    # Results come back in input order so the merged rows match the serial scan exactly.
+    if workers<=1 or len(paths)<2:return [extract_file_rows_safe(p) for p in paths]
+    out=[]
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for res in pool.map(extract_file_rows_safe,paths,chunksize=max(1,len(paths)//(workers*4))):out.append(res)
+    except Exception as exc:
+        logger.log(f"WARN scan worker pool failed ({exc.__class__.__name__}: {exc}); finishing {len(paths)-len(out)} files serially")
+        out.extend(extract_file_rows_safe(p) for p in paths[len(out):])
     return out
 
-def enrich_social_links(competitors:List[Dict[str,str]],timeout_sec:int,logger:StepLogger)->List[Dict[str,str]]:
+def extract_competitors_from_sources(scan_root:Path,logger:StepLogger,cache:ScanCache|None=None,workers:int=1,ignore:ScanIgnore|None=None,max_bytes:int=0,registry:CompetitorRegistry|None=None)->List[Dict[str,str]]:
+    summary=defaultdict(Counter)
+    files=list(iter_scan_files(scan_root,ignore,max_bytes,summary));slots=[[] for _ in files];todo=[]
+    log_scan_summary(summary,logger)
+    for i,p in enumerate(files):
+        try:
+            rows=cache.get(p) if cache is not None else None
+        except OSError as exc:
+            logger.log(f"WARN extract failed: {p} -> {exc}");continue
+        if rows is None:todo.append(i)
+        else:slots[i]=rows
+    for i,(rows,err) in zip(todo,run_extraction([files[i] for i in todo],workers,logger)):
+        if err:logger.log(f"WARN extract failed: {files[i]} -> {err}");continue
+        slots[i]=rows
+        if cache is not None:cache.put(files[i],rows)
+    if workers>1 and todo:logger.log(f"Source scan used {workers} worker processes for {len(todo)} files")
+    registry=registry if registry is not None else CompetitorRegistry();extracted=0
+    for rows in slots:
+        registry.upsert_many(rows);extracted+=len(rows)
+    for c in CORE_COMPETITORS:
+        registry.upsert({"competitor_name":c["competitor_name"],"website_domain":c["website_domain"],"website_url":c["website_url"],"facebook_page_url":"","instagram_handle":"","notes_source_file":"seed_core","confidence":"low","missing_page_url":"true"});extracted+=1
+    if cache is not None:cache.save(logger)
+    registry.retain(is_valid_competitor_row)
+    logger.log(f"Scanned {len(files)} files, extracted {extracted} rows, filtered/deduped to {len(registry)} competitors")
+    return registry.rows()
+
+BROWSER_HEADERS={"User-Agent":"Mozilla/5.0","Accept-Language":"en-US,en;q=0.9"}
+
+def make_http_session(pool_size:int=10):
+    # Keep-alive session whose connection pool is sized for the worker count.
+    s=requests.Session();s.headers.update(BROWSER_HEADERS)
+    adapter=requests.adapters.HTTPAdapter(pool_connections=pool_size,pool_maxsize=pool_size)
+    s.mount("https://",adapter);s.mount("http://",adapter)
+    return s
+
+# Per-host politeness: at most `per_host` requests in flight and `min_interval` seconds between starts.
+class HostLimiter:
+    def __init__(self,per_host:int=1,min_interval:float=0.0)->None:
+        self.per_host=max(1,per_host);self.min_interval=min_interval;self._lock=threading.Lock();self._sems={};self._next={}
+    @contextmanager
+    def slot(self,url:str):
+        host=normalize_domain(url)
+        with self._lock:sem=self._sems.setdefault(host,threading.Semaphore(self.per_host))
+        with sem:
+            with self._lock:
+                now=time.monotonic();start=max(now,self._next.get(host,0.0));self._next[host]=start+self.min_interval
+            if start>now:time.sleep(start-now)
+            yield
+
+# Incremental Facebook/Instagram link matcher over a streamed body. A tail of the text is carried
+# between chunks so links split across chunk boundaries still match; a match touching the end of
+# the buffer is deferred because it may continue in the next chunk.
+class SocialLinkScanner:
+    def __init__(self,need_fb:bool=True,need_ig:bool=True)->None:
+        self.need_fb=need_fb;self.need_ig=need_ig;self.fb_urls=[];self.ig_urls=[]
+        self._buf="";self._offset=0;self._resume=[0,0]
+    def feed(self,text:str,final:bool=False)->None:
+        self._buf+=text;cut=max(0,len(self._buf)-SOCIAL_SCAN_OVERLAP_CHARS)
+        for i,(rx,out) in enumerate(((FB_URL_RE,self.fb_urls),(IG_URL_RE,self.ig_urls))):
+            # Resume after the last accepted match so results equal one findall over the whole body.
+            for m in rx.finditer(self._buf,max(0,self._resume[i]-self._offset)):
+                # A match touching the end may still grow: keep the buffer from its start (e.g. long tracking hrefs).
+                if not final and m.end()==len(self._buf):cut=min(cut,m.start());break
+                out.append(m.group(0));self._resume[i]=self._offset+m.end()
+        self._offset+=cut;self._buf=self._buf[cut:]
+    def done(self)->bool:
+        # Stop early only on a clean page slug: a profile.php capture never carries id= (FB_URL_RE stops at "?")
+        # and is later discarded, and a longer slug URL could still lose to a shorter one further down the page.
+        return (not self.need_fb or is_facebook_page_slug(pick_best_facebook_url(self.fb_urls))) and (not self.need_ig or bool(instagram_handles_from_urls(self.ig_urls)))
+
+def fetch_homepage(session,limiter:HostLimiter,url:str,timeout_sec:int,need_fb:bool=True,need_ig:bool=True,max_bytes:int=0,cache:HttpCache|None=None)->Tuple[SocialLinkScanner|None,int,bool]:
+    # Streams the body and closes the connection once both links are found or max_bytes is read.
+    # Returns (scanner or None on failure, bytes read, stopped_early). The cache keeps the streamed
+    # prefix; a fresh or 304-revalidated prefix is reused when it still yields the needed links.
+    key,entry,fresh,cond=cache.prepare(url,source="homepage") if cache is not None else ("",None,False,{})
+    def scan_cached()->SocialLinkScanner|None:
+        sc=SocialLinkScanner(need_fb,need_ig)
+        sc.feed(codecs.decode(cache.read_body(entry),entry.get("encoding") or "utf-8","replace"),final=True)
+        return sc if (sc.done() or not entry.get("partial")) else None
+    try:
+        if entry and fresh and (sc:=scan_cached()) is not None:cache.record("hit");return sc,0,False
+    except (OSError,LookupError):
+        entry,cond=None,{}
+    scanner=SocialLinkScanner(need_fb,need_ig);read=0;body=bytearray();stopped=False
+    try:
+        with limiter.slot(url),session.get(url,timeout=timeout_sec,stream=True,headers=cond) as resp:
+            if resp.status_code==304 and entry:
+                cache.touch(key,resp.headers)
+                if (sc:=scan_cached()) is not None:cache.record("revalidated");return sc,0,False
+            elif resp.status_code!=200:return None,0,False
+            else:
+                encoding=resp.encoding or "utf-8"
+                try:dec=codecs.getincrementaldecoder(encoding)(errors="replace")
+                except LookupError:encoding="utf-8";dec=codecs.getincrementaldecoder(encoding)(errors="replace")
+                for chunk in resp.iter_content(chunk_size=16384):
+                    read+=len(chunk);scanner.feed(dec.decode(chunk))
+                    if cache is not None:body.extend(chunk)
+                    if scanner.done() or (max_bytes and read>=max_bytes):
+                        stopped=True;break
+                scanner.feed(dec.decode(b"",final=True),final=True)
+                if cache is not None:cache.store(key,url,resp.headers,bytes(body),encoding,source="homepage",partial=stopped);cache.record("miss")
+                return scanner,read,stopped
+    except Exception:
+        return None,read,False
+    # 304 on a partial prefix that lacks the links: refetch without the cache, but only after the host
+    # slot above is released (the per-host semaphore is not re-entrant).
+    return fetch_homepage(session,limiter,url,timeout_sec,need_fb,need_ig,max_bytes,None)
+
+def enrich_social_links(competitors:List[Dict[str,str]],timeout_sec:int,logger:StepLogger,workers:int=8,max_bytes:int=512*1024,http_cache:HttpCache|None=None)->List[Dict[str,str]]:
     if requests is None:return competitors
+    todo=[]
     for r in competitors:
         if is_invalid_facebook_url(r.get("facebook_page_url","")):
             r["facebook_page_url"]=""
         r["instagram_handle"]=normalize_ig_handle(r.get("instagram_handle",""))
         if r.get("facebook_page_url") and r.get("instagram_handle"):continue
-        url=r.get("website_url","")
-        if not url:continue
+        if r.get("website_url",""):todo.append(r)
+    started=time.monotonic();workers=max(1,min(workers,len(todo) or 1));limiter=HostLimiter(per_host=1,min_interval=1.0)
+    with make_http_session(workers) as session,ThreadPoolExecutor(max_workers=workers) as pool:
+        results=list(pool.map(lambda r:fetch_homepage(session,limiter,r["website_url"],timeout_sec,not r.get("facebook_page_url"),not r.get("instagram_handle"),max_bytes,http_cache),todo))
+    logger.log(f"Social enrichment fetched {len(todo)} homepages with {workers} workers in {time.monotonic()-started:.1f}s, ok={sum(1 for x in results if x[0] is not None)}, bytes_read={sum(x[1] for x in results)}, stopped_early={sum(1 for x in results if x[2])}")
+    # Results are applied in list order, so picks do not depend on which fetch finished first.
+    for r,(scanner,_,_) in zip(todo,results):
+        if scanner is None:continue
         try:
-            resp=requests.get(url,headers={"User-Agent":"Mozilla/5.0","Accept-Language":"en-US,en;q=0.9"},timeout=timeout_sec)
-            if resp.status_code!=200:continue
-            body=resp.text
             if not r.get("facebook_page_url"):
-                fb=extract_facebook_urls(body)
-                best_fb=pick_best_facebook_url(fb)
+                best_fb=pick_best_facebook_url(scanner.fb_urls)
                 if best_fb:r["facebook_page_url"]=best_fb
             if not r.get("instagram_handle"):
-                ig=extract_instagram_handles(body)
+                ig=instagram_handles_from_urls(scanner.ig_urls)
                 if ig:r["instagram_handle"]=ig[0]
             # Filter noisy FB placeholders commonly found in widgets.
             fbv=(r.get("facebook_page_url","") or "").lower()
@@ -307,41 +754,19 @@ def enrich_social_links(competitors:List[Dict[str,str]],timeout_sec:int,logger:S
                 break
     return competitors
 
-def normalize_baseline_competitors(rows:List[Dict[str,str]])->List[Dict[str,str]]:
-    canon={}
-    for c in CORE_COMPETITORS:
-        canon[c["competitor_name"].lower()]=c
-        canon[normalize_domain(c["website_domain"]).split(".")[0]]=c
-    out=[]
-    for r in rows:
-        k=(r.get("competitor_name","")+r.get("website_domain","")).lower()
-        for token,patch in canon.items():
-            if token in k:
-                r.update({**patch,**r})
-                for pk,pv in patch.items():
-                    if pk in ("competitor_name","website_domain","website_url"):r[pk]=pv
-                break
-        r["missing_page_url"]="true" if not (r.get("facebook_page_url") or r.get("instagram_handle")) else "false"
-        r["confidence"]=confidence_level(r)
-        out.append(r)
-    merged=dedupe_competitors(out)
-    # Guarantee core competitors exist in master list.
-    existing={normalize_domain(x.get("website_domain","") or x.get("website_url","")) for x in merged}
-    for c in CORE_COMPETITORS:
-        dom=normalize_domain(c["website_domain"])
-        if dom in existing:
-            continue
-        merged.append({
-            "competitor_name":c["competitor_name"],
-            "website_domain":dom,
-            "website_url":c["website_url"],
-            "facebook_page_url":"",
-            "instagram_handle":"",
-            "notes_source_file":"seed_core",
-            "confidence":"medium",
-            "missing_page_url":"true",
-        })
-    return dedupe_competitors(merged)
+# Append-as-you-go CSV writer (thread-safe) for rows produced page by page.
+class CsvStreamWriter:
+    def __init__(self,path:Path,fields:Sequence[str])->None:
+        path.parent.mkdir(parents=True,exist_ok=True)
+        self.fields=list(fields);self.count=0;self._lock=threading.Lock()
+        self._f=path.open("w",newline="",encoding="utf-8");self._w=csv.DictWriter(self._f,fieldnames=self.fields);self._w.writeheader()
+    def write_rows(self,rows:Sequence[Dict[str,str]])->None:
+        with self._lock:
+            for r in rows:self._w.writerow({k:r.get(k,"") for k in self.fields})
+            self.count+=len(rows);self._f.flush()
+    def close(self)->None:self._f.close()
+    def __enter__(self)->"CsvStreamWriter":return self
+    def __exit__(self,*exc)->None:self.close()
 
 def write_csv(path:Path,fields:Sequence[str],rows:Sequence[Dict[str,str]])->None:
     path.parent.mkdir(parents=True,exist_ok=True)
@@ -355,30 +780,113 @@ def read_csv_rows(path:Path)->List[Dict[str,str]]:
     with path.open("r",encoding="utf-8",newline="") as f:
         return list(csv.DictReader(f))
 
-def build_ad_library_url(facebook_page_url:str,competitor_name:str)->str:
+def iter_csv_rows(path:Path):
+    # Streaming counterpart of read_csv_rows for large files written by CsvStreamWriter.
+    if not path.exists():return
+    with path.open("r",encoding="utf-8",newline="") as f:yield from csv.DictReader(f)
+
+def build_ad_library_url(facebook_page_url:str,competitor_name:str,base_url:str=AD_LIBRARY_BASE_URL)->str:
     slug=""
     if facebook_page_url:
         try:
             parts=[x for x in urlparse(facebook_page_url).path.split("/") if x];slug=parts[0] if parts else ""
         except Exception:slug=""
     q=(slug or competitor_name or "").strip()
-    return "https://www.facebook.com/ads/library/?active_status=active&ad_type=all&country=HK&is_targeted_country=false&media_type=all&search_type=keyword&q="+quote_plus(q)
+    return base_url+"?active_status=active&ad_type=all&country=HK&is_targeted_country=false&media_type=all&search_type=keyword&q="+quote_plus(q)
+
+def ad_library_page_url(url:str,cursor:str)->str:
+    return url+"&forward_cursor="+quote_plus(cursor)
+
+def ad_page_record_path(record_dir:Path,url:str,cursor:str)->Path:
+    # Layout shared with scripts/replay_ad_library.py: <dir>/<q>/<cursor or "first">.txt
+    q=(parse_qs(urlparse(url).query).get("q") or [""])[0] or "_"
+    safe=lambda v:re.sub(r"[^A-Za-z0-9_.-]","_",v)[:120]
+    return record_dir/safe(q)/((safe(cursor) if cursor else "first")+".txt")
+
+SCRIPT_ISLAND_RE=re.compile(r"<script\b[^>]*>(.*?)</script>",re.S|re.I)
+# Single alternation for pages without JSON islands: first hit per field in one scan.
+LEGACY_AD_FIELDS_RE=re.compile(r'"result_count"\s*:\s*(?P<count>\d+)|"ad_archive_id"\s*:\s*"?(?P<id>\d+)"?|"call_to_action_type"\s*:\s*"(?P<cta>[A-Z_]+)"|"body"\s*:\s*\{"text"\s*:\s*"(?P<body>[^"]+)"|"title"\s*:\s*"(?P<title>[^"]+)"')
+
+def iter_json_documents(text:str):
+    # Yields every top-level JSON value in `text` (GraphQL responses may concatenate several).
+    dec=json.JSONDecoder();i=0;n=len(text)
+    if text.startswith("for (;;);"):i=9
+    while i<n:
+        while i<n and text[i] in " \t\r\n":i+=1
+        if i>=n or text[i] not in "{[":return
+        try:obj,i=dec.raw_decode(text,i)
+        except ValueError:return
+        yield obj
+
+def iter_payload_documents(body:str):
+    s=body.lstrip()
+    if s.startswith(("{","[","for (;;);")):
+        yield from iter_json_documents(s);return
+    for m in SCRIPT_ISLAND_RE.finditer(body):
+        island=m.group(1).strip()
+        if island.startswith(("{","[")):yield from iter_json_documents(island)
+
+def _text_of(v)->str:
+    if isinstance(v,dict):v=v.get("text","")
+    return html.unescape(v) if isinstance(v,str) else ""
+
+def ad_card_from_node(node:Dict)->Dict[str,str]:
+    snap=node.get("snapshot") if isinstance(node.get("snapshot"),dict) else node
+    cards=[c for c in (snap.get("cards") or []) if isinstance(c,dict)]
+    first=cards[0] if cards else {}
+    start=node.get("start_date") or snap.get("start_date") or ""
+    if isinstance(start,(int,float)) and start>0:start=dt.datetime.fromtimestamp(start,dt.timezone.utc).date().isoformat()
+    cta=snap.get("cta_type") or node.get("call_to_action_type") or first.get("cta_type") or ""
+    return {
+        "ad_archive_id":str(node.get("ad_archive_id") or ""),
+        "start_date":str(start or ""),
+        "primary_text":_text_of(snap.get("body")) or _text_of(first.get("body")),
+        "headline":_text_of(snap.get("title")) or _text_of(first.get("title")),
+        "call_to_action":str(cta).lower(),
+        "landing_page_url":html.unescape(str(snap.get("link_url") or first.get("link_url") or "")),
+    }
+
+def extract_meta_ad_cards(body:str)->Tuple[List[Dict[str,str]],str,str]:
+    # One pass over the embedded JSON islands: every object carrying ad_archive_id becomes a card.
+    # Returns (cards in page order, result_count or "", continuation cursor or "").
+    cards=[];seen=set();count="";cursor=""
+    for doc in iter_payload_documents(body or ""):
+        stack=[doc]
+        while stack:
+            node=stack.pop()
+            if isinstance(node,dict):
+                if not count and isinstance(node.get("result_count"),(int,str)) and str(node["result_count"]).isdigit():count=str(node["result_count"])
+                if not cursor:
+                    c=node.get("forward_cursor") or node.get("forwardCursor") or (node.get("end_cursor") if node.get("has_next_page",True) else "")
+                    if isinstance(c,str):cursor=c
+                if node.get("ad_archive_id"):
+                    card=ad_card_from_node(node)
+                    if card["ad_archive_id"] not in seen:seen.add(card["ad_archive_id"]);cards.append(card)
+                    continue
+                stack.extend(reversed(list(node.values())))
+            elif isinstance(node,list):
+                stack.extend(reversed(node))
+    return cards,count,cursor
 
 def parse_meta_ad_library_html(body:str)->Dict[str,str]:
+    if not body:return {}
+    cards,count,_=extract_meta_ad_cards(body)
+    return summarize_ad_page(body,cards,count)
+
+def summarize_ad_page(body:str,cards:Sequence[Dict[str,str]],count:str)->Dict[str,str]:
     p={}
-    if not body:return p
-    m=re.search(r'"result_count"\s*:\s*(\d+)',body)
-    if m:p["ad_count_active"]=m.group(1)
-    a=re.search(r'"ad_archive_id"\s*:\s*"?(\d+)"?',body)
-    if a:p["ad_id_or_archive_id"]=a.group(1)
-    cta=re.search(r'"call_to_action_type"\s*:\s*"([A-Z_]+)"',body)
-    if cta:p["call_to_action"]=cta.group(1).lower()
-    link=re.search(r'https?://[^"\s]+',body)
-    if link:p["landing_page_url"]=html.unescape(link.group(0))
-    b=re.search(r'"body"\s*:\s*\{"text"\s*:\s*"([^"]+)"',body)
-    if b:p["primary_text"]=html.unescape(b.group(1))
-    h=re.search(r'"title"\s*:\s*"([^"]+)"',body)
-    if h:p["headline"]=html.unescape(h.group(1))
+    if cards or count:
+        p["ad_count_active"]=count or str(len(cards))
+        first=cards[0] if cards else {}
+        for src,dst in (("ad_archive_id","ad_id_or_archive_id"),("primary_text","primary_text"),("headline","headline"),("call_to_action","call_to_action"),("landing_page_url","landing_page_url")):
+            if first.get(src):p[dst]=first[src]
+        return p
+    for m in LEGACY_AD_FIELDS_RE.finditer(body):
+        g=m.lastgroup;v=m.group(g)
+        dst={"count":"ad_count_active","id":"ad_id_or_archive_id","cta":"call_to_action","body":"primary_text","title":"headline"}[g]
+        if dst in p:continue
+        p[dst]=v.lower() if g=="cta" else (html.unescape(v) if g in ("body","title") else v)
+        if len(p)==5:break
     return p
 
 def infer_objective_and_destination(r:Dict[str,str])->Tuple[str,str,str]:
@@ -398,45 +906,244 @@ def infer_format_hint(r:Dict[str,str])->str:
     if "video" in t:return "video"
     return "image" if t else "unknown"
 
-def collect_meta_ads(competitors:Sequence[Dict[str,str]],timeout_sec:int,logger:StepLogger)->Tuple[List[Dict[str,str]],List[Dict[str,str]]]:
-    rows=[];todos=[]
-    if requests is None:logger.log("requests not installed; all Meta rows set to manual_needed")
-    for c in competitors:
-        name,fb_url=c.get("competitor_name",""),c.get("facebook_page_url","")
-        base={"competitor_name":name,"advertiser_name":name,"facebook_page_url":fb_url,"ad_library_url":build_ad_library_url(fb_url,name),"ad_count_active":"","ad_id_or_archive_id":"","status":"unknown","platforms_hint":"unknown","ad_format_hint":"unknown","objective_path_hint":"unknown","objective_reason":"Insufficient signals; manual review required.","message_destination_hint":"unknown","landing_page_url":"","primary_text":"","headline":"","call_to_action":"","captured_at":now_iso(),"collection_method":"manual_needed","error_reason":"","manual_required_fields":"call_to_action,landing_page_url_or_message_destination","manual_instructions":"Open ad_library_url and fill CTA type + landing page URL or WhatsApp/Messenger destination."}
-        if not fb_url and not c.get("instagram_handle",""):
-            base["error_reason"]="missing_facebook_or_instagram"
-            rows.append(base);todos.append(base.copy());continue
-        if not fb_url:
-            base["error_reason"]="missing_facebook_page_url"
-            rows.append(base);todos.append(base.copy());continue
-        if requests is None:base["error_reason"]="requests_not_available";rows.append(base);todos.append(base.copy());continue
+# Persistent memo of ad-copy analytics keyed by a hash of the copy fields each result depends on. The file
+# belongs to one ruleset (COPY_RULES_VERSION + TagMatcher.version): editing TAG_RULES or --tag-rules, or
+# bumping COPY_RULES_VERSION, starts an empty memo. Entries unused for COPY_MEMO_MAX_AGE_SEC are pruned on save.
+class CopyMemo:
+    def __init__(self,path:Path|None,ruleset:str="")->None:
+        self.path=path;self.ruleset=f"{COPY_RULES_VERSION}:{ruleset}";self.entries:Dict[str,Dict]={};self.hits=0;self.misses=0;self._lock=threading.Lock();self._now=time.time()
+        if path is None:return
         try:
-            resp=requests.get(base["ad_library_url"],headers={"User-Agent":"Mozilla/5.0","Accept-Language":"en-US,en;q=0.9"},timeout=timeout_sec)
-            if resp.status_code!=200:
-                base["error_reason"]=f"http_{resp.status_code}"
-                if resp.status_code in (401,403):
-                    base["status"]="unknown_blocked"
-                    base["objective_reason"]="Access blocked by Meta Ad Library (http_403/http_401), requires manual confirmation."
-                rows.append(base);todos.append(base.copy());continue
-            parsed=parse_meta_ad_library_html(resp.text);merged=base.copy();merged.update(parsed)
-            o,d,reason=infer_objective_and_destination(merged);merged["objective_path_hint"]=o;merged["message_destination_hint"]=d;merged["objective_reason"]=reason;merged["ad_format_hint"]=infer_format_hint(merged);merged["platforms_hint"]="facebook/instagram"
-            if parsed:
-                merged["collection_method"]="web_auto"
-                merged["manual_required_fields"]=""
-                merged["manual_instructions"]=""
-                if merged.get("ad_count_active"):
-                    try:merged["status"]="active" if int(merged["ad_count_active"])>0 else "unknown"
-                    except Exception:merged["status"]="unknown"
-                rows.append(merged)
-            else:
-                merged["collection_method"]="manual_needed";merged["error_reason"]="dynamic_render_or_no_parseable_fields";rows.append(merged);todos.append(merged.copy())
-        except Exception as exc:
-            base["error_reason"]=f"request_error:{exc.__class__.__name__}"
+            data=json.loads(path.read_text(encoding="utf-8"))
+            if data.get("ruleset")==self.ruleset:self.entries=data.get("entries",{})
+        except Exception:
+            self.entries={}
+    @staticmethod
+    def key(kind:str,fields:Sequence[str])->str:
+        return kind+":"+hashlib.sha1("\x1f".join(f or "" for f in fields).encode("utf-8")).hexdigest()
+    def lookup(self,kind:str,fields:Sequence[str],compute)->tuple:
+        key=self.key(kind,fields)
+        with self._lock:
+            e=self.entries.get(key)
+            if e is not None:e["at"]=self._now;self.hits+=1;return tuple(e["v"])
+        v=tuple(compute())
+        with self._lock:self.entries[key]={"v":list(v),"at":self._now};self.misses+=1
+        return v
+    def save(self,logger:StepLogger)->None:
+        if self.path is None:return
+        with self._lock:
+            stale=[k for k,e in self.entries.items() if self._now-e.get("at",0)>COPY_MEMO_MAX_AGE_SEC]
+            for k in stale:del self.entries[k]
+            logger.log(f"Copy memo: hits={self.hits}, misses={self.misses}, pruned={len(stale)}, entries={len(self.entries)}, path={self.path}")
+            try:
+                self.path.parent.mkdir(parents=True,exist_ok=True)
+                tmp=self.path.with_suffix(self.path.suffix+".tmp")
+                tmp.write_text(json.dumps({"ruleset":self.ruleset,"entries":self.entries},ensure_ascii=False),encoding="utf-8")
+                os.replace(tmp,self.path)
+            except OSError as exc:
+                logger.log(f"WARN copy memo not saved: {exc}")
+
+COPY_HINT_FIELDS=["primary_text","headline","call_to_action","landing_page_url"]
+
+def infer_creative_hints(r:Dict[str,str],memo:CopyMemo|None=None)->Tuple[str,str,str,str]:
+    # (objective, destination, reason, format hint); both inferences only read COPY_HINT_FIELDS.
+    compute=lambda:(*infer_objective_and_destination(r),infer_format_hint(r))
+    return memo.lookup("hints",[r.get(f,"") or "" for f in COPY_HINT_FIELDS],compute) if memo is not None else compute()
+
+# Per-host circuit breaker: after `threshold` consecutive blocks (401/403/429 or request errors) the
+# host is open and calls are refused; after `cooldown` seconds a single probe is let through and its
+# outcome closes or re-opens the breaker.
+class CircuitBreaker:
+    def __init__(self,threshold:int=3,cooldown:float=60.0)->None:
+        self.threshold=max(1,threshold);self.cooldown=cooldown;self._lock=threading.Lock();self._fails=Counter();self._opened={};self._probing=set();self.last_reason={}
+    def allow(self,host:str)->bool:
+        with self._lock:
+            opened=self._opened.get(host)
+            if opened is None:return True
+            if time.monotonic()-opened<self.cooldown or host in self._probing:return False
+            self._probing.add(host);return True
+    def record(self,host:str,blocked:bool,reason:str="",success:bool=True)->None:
+        # Only a success (2xx/304) closes the breaker. Other non-blocking failures (e.g. 5xx) leave the
+        # counts alone; if that call was the half-open probe, the breaker stays open for another cooldown.
+        with self._lock:
+            probe=host in self._probing;self._probing.discard(host)
+            if blocked:
+                self._fails[host]+=1;self.last_reason[host]=reason
+                if self._fails[host]>=self.threshold:self._opened[host]=time.monotonic()
+            elif success:self._fails[host]=0;self._opened.pop(host,None)
+            elif probe and host in self._opened:self._opened[host]=time.monotonic()
+    def is_open(self,host:str)->bool:
+        with self._lock:return host in self._opened
+
+def meta_base_row(c:Dict[str,str],base_url:str=AD_LIBRARY_BASE_URL)->Dict[str,str]:
+    name,fb_url=c.get("competitor_name",""),c.get("facebook_page_url","")
+    return {"competitor_name":name,"advertiser_name":name,"facebook_page_url":fb_url,"ad_library_url":build_ad_library_url(fb_url,name,base_url),"ad_count_active":"","ad_id_or_archive_id":"","status":"unknown","platforms_hint":"unknown","ad_format_hint":"unknown","objective_path_hint":"unknown","objective_reason":"Insufficient signals; manual review required.","message_destination_hint":"unknown","landing_page_url":"","primary_text":"","headline":"","call_to_action":"","captured_at":now_iso(),"collection_method":"manual_needed","error_reason":"","manual_required_fields":"call_to_action,landing_page_url_or_message_destination","manual_instructions":"Open ad_library_url and fill CTA type + landing page URL or WhatsApp/Messenger destination."}
+
+def fetch_meta_row(base:Dict[str,str],session,timeout_sec:int,breaker:CircuitBreaker,http_cache:HttpCache|None=None,max_ads:int=200,card_sink=None,record_dir:Path|None=None,memo:CopyMemo|None=None)->Tuple[Dict[str,str],bool,int,bool]:
+    # Returns (row, needs_manual_todo, ad cards harvested, every active ad enumerated). Follows the
+    # continuation cursor up to max_ads and hands each page's cards to card_sink as soon as the page is parsed.
+    host=urlparse(base["ad_library_url"]).netloc
+    def get_page(cursor:str):
+        url=ad_library_page_url(base["ad_library_url"],cursor) if cursor else base["ad_library_url"]
+        if http_cache is not None:resp=http_cache.get(url,headers=BROWSER_HEADERS,timeout=timeout_sec,source="meta_ad_library",session=session)
+        else:resp=session.get(url,timeout=timeout_sec)
+        if record_dir is not None and resp.status_code==200:
+            path=ad_page_record_path(record_dir,base["ad_library_url"],cursor);path.parent.mkdir(parents=True,exist_ok=True);path.write_text(resp.text,encoding="utf-8")
+        return resp
+    seen=set();truncated=False
+    def emit(page_cards:Sequence[Dict[str,str]])->int:
+        nonlocal truncated
+        fresh=[c for c in page_cards if c["ad_archive_id"] not in seen];room=max(0,max_ads-len(seen))
+        if len(fresh)>room:fresh=fresh[:room];truncated=True
+        seen.update(c["ad_archive_id"] for c in fresh)
+        if fresh and card_sink is not None:card_sink([{"competitor_name":base["competitor_name"],"ad_library_url":base["ad_library_url"],**c,"captured_at":base["captured_at"]} for c in fresh])
+        return len(fresh)
+    if not breaker.allow(host):
+        base["error_reason"]=f"circuit_open:{breaker.last_reason.get(host,'blocked')}"
+        base["status"]="unknown_blocked"
+        base["objective_reason"]="Skipped: Meta Ad Library blocked repeated requests in this run (circuit breaker open), requires manual confirmation."
+        return base,True,0,False
+    try:
+        resp=get_page("")
+    except Exception as exc:
+        breaker.record(host,True,f"request_error:{exc.__class__.__name__}")
+        base["error_reason"]=f"request_error:{exc.__class__.__name__}"
+        base["status"]="unknown_blocked"
+        base["objective_reason"]="Request failed while querying Ad Library; requires manual confirmation."
+        return base,True,0,False
+    if resp.status_code!=200:
+        breaker.record(host,resp.status_code in (401,403,429),f"http_{resp.status_code}",success=False)
+        base["error_reason"]=f"http_{resp.status_code}"
+        if resp.status_code in (401,403):
             base["status"]="unknown_blocked"
-            base["objective_reason"]="Request failed while querying Ad Library; requires manual confirmation."
-            rows.append(base);todos.append(base.copy())
-    return rows,todos
+            base["objective_reason"]="Access blocked by Meta Ad Library (http_403/http_401), requires manual confirmation."
+        return base,True,0,False
+    breaker.record(host,False)
+    body=resp.text;cards,count,cursor=extract_meta_ad_cards(body)
+    parsed=summarize_ad_page(body,cards,count);merged=base.copy();merged.update(parsed)
+    emit(cards);visited=set();complete=False
+    while True:
+        # No cursor only proves completeness when the page's own result_count is accounted for.
+        if not cursor:complete=(bool(seen) or count=="0") and not truncated and (not count.isdigit() or int(count)<=len(seen));break
+        if cursor in visited or len(seen)>=max_ads or not breaker.allow(host):break
+        visited.add(cursor)
+        try:resp=get_page(cursor)
+        except Exception as exc:
+            breaker.record(host,True,f"request_error:{exc.__class__.__name__}");break
+        if resp.status_code!=200:
+            breaker.record(host,resp.status_code in (401,403,429),f"http_{resp.status_code}",success=False);break
+        breaker.record(host,False)
+        page_cards,_,cursor=extract_meta_ad_cards(resp.text)
+        if not emit(page_cards):break
+    merged,todo=finalize_meta_row(merged,parsed,count,len(seen),memo=memo)
+    return merged,todo,len(seen),complete
+
+def finalize_meta_row(merged:Dict[str,str],parsed:Dict[str,str],count:str,n_cards:int,method:str="web_auto",memo:CopyMemo|None=None)->Tuple[Dict[str,str],bool]:
+    if not count and n_cards>1:merged["ad_count_active"]=str(n_cards)
+    o,d,reason,fmt=infer_creative_hints(merged,memo);merged["objective_path_hint"]=o;merged["message_destination_hint"]=d;merged["objective_reason"]=reason;merged["ad_format_hint"]=fmt;merged["platforms_hint"]="facebook/instagram"
+    if parsed:
+        merged["collection_method"]=method
+        merged["error_reason"]=""
+        merged["manual_required_fields"]=""
+        merged["manual_instructions"]=""
+        if merged.get("ad_count_active"):
+            try:merged["status"]="active" if int(merged["ad_count_active"])>0 else "unknown"
+            except Exception:merged["status"]="unknown"
+        return merged,False
+    merged["collection_method"]="manual_needed";merged["error_reason"]="dynamic_render_or_no_parseable_fields"
+    return merged,True
+
+def collect_meta_ads(competitors:Sequence[Dict[str,str]],timeout_sec:int,logger:StepLogger,http_cache:HttpCache|None=None,workers:int=4,breaker:CircuitBreaker|None=None,max_ads:int=200,card_sink=None,base_url:str=AD_LIBRARY_BASE_URL,record_dir:Path|None=None,memo:CopyMemo|None=None)->Tuple[List[Dict[str,str]],List[Dict[str,str]],List[str]]:
+    # Returns (rows, todos, competitors whose active ads were fully enumerated this run).
+    if requests is None:logger.log("requests not installed; all Meta rows set to manual_needed")
+    slots=[];fetch=[]
+    for c in competitors:
+        base=meta_base_row(c,base_url);fb_url=base["facebook_page_url"]
+        if not fb_url and not c.get("instagram_handle",""):base["error_reason"]="missing_facebook_or_instagram"
+        elif not fb_url:base["error_reason"]="missing_facebook_page_url"
+        elif requests is None:base["error_reason"]="requests_not_available"
+        else:fetch.append(len(slots))
+        slots.append((base,True,0,False))
+    if fetch:
+        breaker=breaker or CircuitBreaker();workers=max(1,min(workers,len(fetch)));started=time.monotonic()
+        with make_http_session(workers) as session,ThreadPoolExecutor(max_workers=workers) as pool:
+            for i,res in zip(fetch,pool.map(lambda i:fetch_meta_row(slots[i][0],session,timeout_sec,breaker,http_cache,max_ads,card_sink,record_dir,memo),fetch)):slots[i]=res
+        skipped=sum(1 for i in fetch if slots[i][0].get("error_reason","").startswith("circuit_open:"))
+        logger.log(f"Meta Ad Library: fetched {len(fetch)-skipped}/{len(fetch)} with {workers} workers in {time.monotonic()-started:.1f}s, circuit_skipped={skipped}")
+    rows=[];todos=[];n_cards=0;complete=[]
+    for row,todo,row_cards,done in slots:
+        rows.append(row);n_cards+=row_cards
+        if todo:todos.append(row.copy())
+        if done:complete.append(row["competitor_name"])
+    if fetch:logger.log(f"Meta Ad Library: harvested {n_cards} ad cards (cap {max_ads} per advertiser), fully enumerated advertisers={len(complete)}")
+    return rows,todos,complete
+
+async def render_ad_library_row(context,base:Dict[str,str],timeout_sec:int,max_ads:int,card_sink=None,memo:CopyMemo|None=None)->Tuple[Dict[str,str],bool,int]:
+    # Loads the Ad Library page in a pooled context and parses the GraphQL/XHR JSON it receives
+    # (not the DOM), scrolling until max_ads or two idle rounds without new cards.
+    page=await context.new_page();captured=[];seen=set();cards=[];count=""
+    page.on("response",lambda resp:captured.append(resp) if resp.request.resource_type in RENDER_CAPTURED_RESOURCES else None)
+    try:
+        await page.goto(base["ad_library_url"],wait_until="domcontentloaded",timeout=timeout_sec*1000)
+        done=0;idle=0
+        while len(seen)<max_ads and idle<2:
+            await page.wait_for_timeout(1500)
+            fresh=[]
+            for resp in captured[done:]:
+                try:body=await resp.text()
+                except Exception:continue
+                page_cards,page_count,_=extract_meta_ad_cards(body);count=count or page_count
+                for c in page_cards:
+                    if c["ad_archive_id"] not in seen and len(seen)<max_ads:seen.add(c["ad_archive_id"]);fresh.append(c)
+            done=len(captured);cards.extend(fresh);idle=0 if fresh else idle+1
+            if fresh and card_sink is not None:card_sink([{"competitor_name":base["competitor_name"],"ad_library_url":base["ad_library_url"],**c,"captured_at":base["captured_at"]} for c in fresh])
+            await page.mouse.wheel(0,4000)
+    except Exception as exc:
+        row=base.copy();row["error_reason"]=f"render_error:{exc.__class__.__name__}"
+        return row,True,len(seen)
+    finally:
+        await page.close()
+    parsed=summarize_ad_page("",cards,count);row=base.copy();row.update(parsed)
+    row,todo=finalize_meta_row(row,parsed,count,len(seen),"web_render",memo)
+    return row,todo,len(seen)
+
+async def render_ad_library_pool(targets:Sequence[Tuple[int,Dict[str,str]]],timeout_sec:int,pool_size:int,max_ads:int,card_sink=None,memo:CopyMemo|None=None)->Dict[int,Tuple[Dict[str,str],bool,int]]:
+    # One headless browser; pool_size reusable contexts (the memory cap) pull rows from a shared queue.
+    queue=asyncio.Queue();results={}
+    for t in targets:queue.put_nowait(t)
+    async def block_heavy(route):
+        if route.request.resource_type in RENDER_BLOCKED_RESOURCES:await route.abort()
+        else:await route.continue_()
+    async with async_playwright() as pw:
+        browser=await pw.chromium.launch(headless=True)
+        async def worker():
+            context=await browser.new_context(user_agent=RENDER_USER_AGENT,locale="zh-HK",timezone_id="Asia/Hong_Kong",viewport={"width":1280,"height":2000})
+            await context.route("**/*",block_heavy)
+            try:
+                while not queue.empty():
+                    i,base=queue.get_nowait();results[i]=await render_ad_library_row(context,base,timeout_sec,max_ads,card_sink,memo)
+            finally:
+                await context.close()
+        try:await asyncio.gather(*(worker() for _ in range(max(1,min(pool_size,len(targets))))))
+        finally:await browser.close()
+    return results
+
+def render_meta_fallback(meta_rows:List[Dict[str,str]],todos:List[Dict[str,str]],timeout_sec:int,logger:StepLogger,pool_size:int=2,max_ads:int=200,card_sink=None,memo:CopyMemo|None=None)->Tuple[List[Dict[str,str]],List[Dict[str,str]]]:
+    # Re-tries only dynamic_render_or_no_parseable_fields rows in a headless browser; recovered rows leave the todo queue.
+    targets=[(i,r) for i,r in enumerate(meta_rows) if r.get("error_reason")=="dynamic_render_or_no_parseable_fields"]
+    if not targets:return meta_rows,todos
+    if async_playwright is None:
+        logger.log(f"Render fallback skipped: playwright not installed ({len(targets)} dynamic rows stay in the manual queue)");return meta_rows,todos
+    started=time.monotonic()
+    try:results=asyncio.run(render_ad_library_pool(targets,timeout_sec,pool_size,max_ads,card_sink,memo))
+    except Exception as exc:
+        logger.log(f"WARN render fallback failed: {exc.__class__.__name__}: {sanitize_text(str(exc))}");return meta_rows,todos
+    rows=list(meta_rows);recovered=set()
+    for i,(row,todo,_) in results.items():
+        rows[i]=row
+        if not todo:recovered.add(row["competitor_name"])
+    logger.log(f"Render fallback: recovered {len(recovered)}/{len(targets)} dynamic rows with {min(pool_size,len(targets))} contexts in {time.monotonic()-started:.1f}s, ad cards={sum(n for _,_,n in results.values())}")
+    return rows,[t for t in todos if t.get("competitor_name","") not in recovered]
 
 def merge_manual_todo_fields(new_todos:List[Dict[str,str]],existing_todos:List[Dict[str,str]])->List[Dict[str,str]]:
     if not existing_todos:
@@ -478,7 +1185,7 @@ def merge_manual_todo_fields(new_todos:List[Dict[str,str]],existing_todos:List[D
             out.append(old.copy())
     return out
 
-def apply_manual_overrides(meta_rows:List[Dict[str,str]],todo_rows:List[Dict[str,str]])->List[Dict[str,str]]:
+def apply_manual_overrides(meta_rows:List[Dict[str,str]],todo_rows:List[Dict[str,str]],ad_store:AdStore|None=None,memo:CopyMemo|None=None)->List[Dict[str,str]]:
     idx={(r.get("competitor_name",""),r.get("ad_library_url","")):r for r in todo_rows}
     idx_by_comp={r.get("competitor_name",""):r for r in todo_rows}
     writable=["ad_count_active","ad_id_or_archive_id","status","objective_path_hint","objective_reason","message_destination_hint","landing_page_url","primary_text","headline","call_to_action"]
@@ -508,11 +1215,12 @@ def apply_manual_overrides(meta_rows:List[Dict[str,str]],todo_rows:List[Dict[str
                 merged["objective_reason"]=(merged.get("objective_reason","").strip()+" Manual Ad Library fields populated (copy/CTA/landing/ad_id), marked as active evidence.").strip()
         # Re-infer objective when still unknown but manual fields now exist.
         if (merged.get("objective_path_hint","") or "").lower() in {"", "unknown"}:
-            o,d,reason=infer_objective_and_destination(merged)
+            o,d,reason,_=infer_creative_hints(merged,memo)
             merged["objective_path_hint"]=o
             merged["message_destination_hint"]=d
             if reason:
                 merged["objective_reason"]=reason
+        if ad_store is not None and (merged.get("ad_id_or_archive_id","") or "").strip():ad_store.record_manual(merged)
         out.append(merged)
     return out
 
@@ -536,29 +1244,44 @@ def build_manual_todo_rows(meta_rows:Sequence[Dict[str,str]])->List[Dict[str,str
 
 def tokenize_mixed_text(t:str)->List[str]:
     en=[w.lower() for w in re.findall(r"[A-Za-z][A-Za-z0-9_']{1,}",t or "") if w.lower() not in EN_STOPWORDS]
-    zh=[]
-    for seq in re.findall(r"[\u4e00-\u9fff]{2,}",t or ""):
-        if seq in ZH_STOPWORDS:continue
-        zh.append(seq)
-        if len(seq)>=4:
-            for i in range(len(seq)-1):
-                g=seq[i:i+2]
-                if g not in ZH_STOPWORDS:zh.append(g)
+    # CJK runs are cut by the dictionary segmenter; tokens keep their original (Traditional or Simplified) form.
+    zh=[w for w in default_segmenter().segment(t) if fold_zh(w) not in ZH_STOPWORDS_FOLDED]
     return en+zh
 
+def most_common_folded(counts:Counter,n:int)->List[Tuple[str,int]]:
+    # Traditional/Simplified variants are counted under their fold_zh key and reported as the most frequent
+    # surface form. Keys are merged in first-occurrence order, so ties rank as in a Counter over folded keys.
+    merged,forms=Counter(),defaultdict(Counter)
+    for w,c in counts.items():
+        k=fold_zh(w);merged[k]+=c;forms[k][w]+=c
+    return [(forms[k].most_common(1)[0][0],c) for k,c in merged.most_common(n)]
+
 def extract_copy_keywords(texts:Sequence[str],top_k_words:int=10,top_k_phrases:int=5)->Tuple[List[Tuple[str,int]],List[Tuple[str,int]]]:
-    wc,pc=Counter(),Counter()
+    # Batch n-gram counting: tokens are interned to int ids and 2-/3-grams are counted as id tuples by
+    # Counter's C loop, so no phrase string is built per window. Each distinct n-gram is joined once at the
+    # end, and phrases are merged back in first-occurrence order (per text: bigrams, trigrams, raw CJK runs),
+    # which keeps most_common ties identical to counting joined strings window by window. Variants that differ
+    # only in Traditional/Simplified script are then merged by most_common_folded.
+    wc,c2,c3,cr=Counter(),Counter(),Counter(),Counter();ids_of:Dict[str,int]={};marks=[]
     for t in texts:
         c=(t or "").strip()
         if not c:continue
         toks=tokenize_mixed_text(c);wc.update(toks)
-        if len(toks)>=2:
-            for n in (2,3):
-                for i in range(0,len(toks)-n+1):
-                    p=" ".join(toks[i:i+n]).strip()
-                    if len(p)>=4:pc[p]+=1
-        pc.update(re.findall(r"[\u4e00-\u9fff]{3,12}",c))
-    return wc.most_common(top_k_words),pc.most_common(top_k_phrases)
+        ids=[ids_of.setdefault(w,len(ids_of)) for w in toks]
+        c2.update(zip(ids,ids[1:]));c3.update(zip(ids,ids[1:],ids[2:]))
+        cr.update(re.findall(r"[\u4e00-\u9fff]{3,12}",c))
+        marks.append((len(c2),len(c3),len(cr)))
+    words=list(ids_of);keys=(list(c2),list(c3),list(cr));pc=Counter();prev=(0,0,0)
+    for m in marks:
+        for key in keys[0][prev[0]:m[0]]:
+            p=words[key[0]]+" "+words[key[1]]
+            if len(p)>=4:pc[p]=c2[key]
+        for key in keys[1][prev[1]:m[1]]:
+            p=words[key[0]]+" "+words[key[1]]+" "+words[key[2]]
+            if len(p)>=4:pc[p]=c3[key]
+        for p in keys[2][prev[2]:m[2]]:pc[p]=cr[p]
+        prev=m
+    return most_common_folded(wc,top_k_words),most_common_folded(pc,top_k_phrases)
 TAG_RULES = {
     "无合约":["no contract","contract-free","cancel anytime","無合約","免合約","无合约"],
     "扫码点单":["qr","scan","qrcode","qr code","掃碼","扫码","點餐","点单"],
@@ -588,16 +1311,39 @@ def normalize_copy_text(text:str)->str:
     s = s.replace("\\n", " ").replace("\n", " ")
     return re.sub(r"\s+", " ", s).strip()
 
-def classify_proposition_tags(text:str, objective_hint:str="", cta:str="", destination:str="")->Tuple[str,str,str]:
+# All tag patterns compiled into one automaton. Pattern ids follow rule order (tag, then pattern), so
+# visiting the hit ids in ascending order reproduces the per-tag/per-pattern scan exactly.
+class TagMatcher:
+    def __init__(self,rules:Dict[str,Sequence[str]])->None:
+        self.rules={tag:list(patterns) for tag,patterns in rules.items()}
+        self.entries=[(tag,p) for tag,patterns in self.rules.items() for p in patterns]
+        self.automaton=TokenAutomaton([p.lower() for _,p in self.entries])
+        self.version=hashlib.sha1(json.dumps(self.rules,ensure_ascii=False,sort_keys=True).encode("utf-8")).hexdigest()[:12]
+    def match(self,t:str)->List[Tuple[str,str]]:
+        return [self.entries[i] for i in sorted(self.automaton.hit_set(t))]
+    @classmethod
+    def load(cls,path:Path|None,base_rules:Dict[str,Sequence[str]]=TAG_RULES)->"TagMatcher":
+        # Extends base_rules from a JSON {tag: [patterns]} or TSV "tag<TAB>pattern" file; new tags go last.
+        rules={tag:list(patterns) for tag,patterns in base_rules.items()}
+        if path is None or not path.exists():return cls(rules)
+        if path.suffix.lower()==".json":
+            extra=[(tag,p) for tag,patterns in json.loads(path.read_text(encoding="utf-8-sig")).items() for p in patterns]
+        else:
+            extra=[tuple(x.strip() for x in ln.split("\t",1)) for ln in path.read_text(encoding="utf-8-sig").splitlines() if ln.strip() and not ln.lstrip().startswith("#") and "\t" in ln]
+        for tag,p in extra:
+            if p and p not in rules.setdefault(tag,[]):rules[tag].append(p)
+        return cls(rules)
+
+TAG_MATCHER=TagMatcher(TAG_RULES)
+
+def classify_proposition_tags(text:str, objective_hint:str="", cta:str="", destination:str="", matcher:TagMatcher|None=None)->Tuple[str,str,str]:
     norm=normalize_copy_text(text)
     t=norm.lower()
     scores=Counter()
     reasons=defaultdict(list)
-    for tag,patterns in TAG_RULES.items():
-        for p in patterns:
-            if p.lower() in t:
-                scores[tag]+=1
-                reasons[tag].append(p)
+    for tag,p in (matcher or TAG_MATCHER).match(t):
+        scores[tag]+=1
+        reasons[tag].append(p)
     # Objective/CTA fallback signals.
     obj=(objective_hint or "").lower()
     cta_l=(cta or "").lower()
@@ -621,19 +1367,21 @@ def classify_proposition_tags(text:str, objective_hint:str="", cta:str="", desti
         reason+=f"; secondary={ranked[1]} via [{r2}]"
     return ranked[0], (ranked[1] if len(ranked)>1 else ""), reason
 
-def build_meta_keyword_rows(meta_rows:Sequence[Dict[str,str]])->List[Dict[str,str]]:
-    out=[];summary=defaultdict(Counter)
-    for r in meta_rows:
+def build_meta_keyword_rows(meta_rows:Iterable[Dict[str,str]],matcher:TagMatcher|None=None,memo:CopyMemo|None=None,clusters:Sequence[str]|None=None)->List[Dict[str,str]]:
+    # memo must have been opened with the same matcher's version; unchanged copy then skips normalize + tagging.
+    # clusters (one near-duplicate cluster id per row) makes competitor_summary count each tag once per cluster
+    # and adds one cluster_summary row per cluster; without it every row counts on its own, as before.
+    out=[];summary=defaultdict(Counter);counted=set();members=defaultdict(list)
+    for i,r in enumerate(meta_rows):
         text=" ".join([r.get("primary_text",""),r.get("headline",""),r.get("call_to_action","")]).strip()
-        p,s,reason=classify_proposition_tags(
-            text,
-            objective_hint=r.get("objective_path_hint",""),
-            cta=r.get("call_to_action",""),
-            destination=r.get("message_destination_hint",""),
-        )
-        comp=r.get("competitor_name","")
-        if p:summary[comp][p]+=1
-        if s:summary[comp][s]+=1
+        fields=[text,r.get("objective_path_hint",""),r.get("call_to_action",""),r.get("message_destination_hint","")]
+        compute=lambda:classify_proposition_tags(fields[0],objective_hint=fields[1],cta=fields[2],destination=fields[3],matcher=matcher)
+        p,s,reason=memo.lookup("tags",fields,compute) if memo is not None else compute()
+        comp=r.get("competitor_name","");cid=clusters[i] if clusters is not None else ""
+        for label in (p,s):
+            if not label or (cid and (comp,cid,label) in counted):continue
+            counted.add((comp,cid,label));summary[comp][label]+=1
+        if cid:members[(comp,cid)].append((p,s))
         out.append({
             "row_type":"ad_tag",
             "competitor_name":comp,
@@ -643,6 +1391,7 @@ def build_meta_keyword_rows(meta_rows:Sequence[Dict[str,str]])->List[Dict[str,st
             "label_secondary":s,
             "label_reason":reason,
             "count":"1",
+            "cluster_id":cid,
         })
     for comp,counter in summary.items():
         for label,count in counter.most_common():
@@ -653,11 +1402,33 @@ def build_meta_keyword_rows(meta_rows:Sequence[Dict[str,str]])->List[Dict[str,st
                 "ad_library_url":"",
                 "label_primary":label,
                 "label_secondary":"",
-                "label_reason":"aggregated tag count",
+                "label_reason":"aggregated tag count, one per near-duplicate cluster" if clusters is not None else "aggregated tag count",
                 "count":str(count),
             })
+    for (comp,cid),tags in members.items():
+        prim=Counter(p for p,_ in tags if p).most_common(1);sec=Counter(s for _,s in tags if s).most_common(1)
+        out.append({
+            "row_type":"cluster_summary",
+            "competitor_name":comp,
+            "ad_id_or_archive_id":"",
+            "ad_library_url":"",
+            "label_primary":prim[0][0] if prim else "",
+            "label_secondary":sec[0][0] if sec else "",
+            "label_reason":f"near-duplicate cluster of {len(tags)} ads; most common tags",
+            "count":str(len(tags)),
+            "cluster_id":cid,
+        })
     return out
 
+def keyword_source_rows(meta_rows:Sequence[Dict[str,str]],with_cards:set,cards,memo:CopyMemo|None=None,infer:bool=True):
+    # Yields one row per harvested ad card (objective hints inferred per card unless infer=False); advertisers
+    # not in with_cards keep their summary row. `cards` may stream from meta_ad_cards.csv; the order is stable.
+    for r in meta_rows:
+        if r.get("competitor_name","") not in with_cards:yield r
+    for c in cards:
+        o,d=infer_creative_hints(c,memo)[:2] if infer else ("","")
+        yield {**c,"ad_id_or_archive_id":c.get("ad_archive_id",""),"objective_path_hint":o,"message_destination_hint":d}
+
 def build_meta_type_distribution(meta_rows:Sequence[Dict[str,str]])->Dict[str,int]:
     by_comp=defaultdict(list)
     for r in meta_rows:by_comp[r.get("competitor_name","")].append(r.get("objective_path_hint","unknown"))
@@ -674,97 +1445,381 @@ def semrush_units(api_key:str)->str:
     except Exception:
         return ""
 
-def semrush_units_info(api_key:str)->Tuple[str,str]:
+SEMRUSH_API_URL="https://api.semrush.com/"
+# Cache identity of a Semrush report request; the API key is deliberately not part of it.
+SEMRUSH_CACHE_KEY_FIELDS=("type","domain","database","display_limit","export_columns","display_date")
+
+def parse_semrush_cache_ttls(specs:Sequence[str])->Dict[str,float]:
+    out={}
+    for spec in specs:
+        report,_,hours=spec.partition("=")
+        try:out[f"semrush:{report.strip()}"]=float(hours)*3600
+        except ValueError:raise SystemExit(f"ERROR: invalid --semrush-cache-ttl {spec!r}, expected TYPE=HOURS")
+    return out
+
+# Account-wide request pacing: `rate` requests per second on average, bursts of up to `burst`.
+class TokenBucket:
+    def __init__(self,rate:float,burst:int=1)->None:
+        self.rate=rate;self.burst=max(1,burst);self.tokens=float(self.burst);self.updated=time.monotonic();self._lock=threading.Lock()
+    def acquire(self)->None:
+        while True:
+            with self._lock:
+                now=time.monotonic();self.tokens=min(self.burst,self.tokens+(now-self.updated)*self.rate);self.updated=now
+                if self.tokens>=1:self.tokens-=1;return
+                wait=(1-self.tokens)/self.rate
+            time.sleep(wait)
+
+SEMRUSH_ADS_REPORT_TYPES=["domain_adwords_adwords","domain_adwords_ads","domain_adwords_unique"]
+
+# Which ads-copy report type works, learned once per (account, database) and persisted with a TTL.
+# Accounts are identified by a truncated sha256 of the API key; the key itself is never written.
+class SemrushCapabilities:
+    def __init__(self,path:Path,ttl_sec:float=7*24*3600)->None:
+        self.path=path;self.ttl_sec=ttl_sec;self._lock=threading.Lock();self._probe_locks:Dict[str,threading.Lock]=defaultdict(threading.Lock);self._dirty=False
+        try:self.entries:Dict[str,Dict]=json.loads(path.read_text(encoding="utf-8"))
+        except Exception:self.entries={}
+    @staticmethod
+    def key(api_key:str,database:str)->str:return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]+":"+database
+    def lookup(self,key:str)->List[str]|None:
+        # [type] when one works, [] when none does, None when unknown or expired.
+        with self._lock:e=self.entries.get(key)
+        if not e or time.time()-e.get("probed_at",0)>self.ttl_sec:return None
+        return [e["supported"]] if e.get("supported") else []
+    def probe_lock(self,key:str)->threading.Lock:
+        with self._lock:return self._probe_locks[key]
+    def learn(self,key:str,results:Dict[str,str])->None:
+        ok=[t for t in SEMRUSH_ADS_REPORT_TYPES if results.get(t)=="ok"]
+        if not ok and any(v=="unknown" for v in results.values()):return
+        with self._lock:self.entries[key]={"supported":ok[0] if ok else "","results":results,"probed_at":time.time()};self._dirty=True
+    def save(self)->None:
+        with self._lock:
+            if not self._dirty:return
+            self.path.parent.mkdir(parents=True,exist_ok=True);tmp=self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(self.entries,indent=2),encoding="utf-8");os.replace(tmp,self.path);self._dirty=False
+
+# Transport shared by every Semrush call in a run: pooled session, limiter, response cache, retry backoff.
+@dataclass
+class SemrushClient:
+    session:object=None
+    limiter:TokenBucket|None=None
+    cache:HttpCache|None=None
+    cache_only:bool=False
+    backoff_base:float=1.0
+    backoff_max:float=30.0
+    capabilities:SemrushCapabilities|None=None
+
+def backoff_delay(attempt:int,base:float,cap:float)->float:
+    # Exponential backoff with full jitter.
+    return random.uniform(0,min(cap,base*(2**attempt)))
+
+# "ERROR 50 :: NOTHING FOUND", bad key or zero balance are final answers; only throttling is retried.
+SEMRUSH_RETRYABLE_ERROR_RE=re.compile(r"^ERROR \d+ :: .*(LIMIT EXCEEDED|TOO MANY|TRY AGAIN|TIMEOUT)",re.I)
+
+def semrush_units_info(api_key:str,client:SemrushClient|None=None)->Tuple[str,str]:
     if not requests:
         return "","requests_not_available"
-    body,err=semrush_request({"type":"api_units","key":api_key},timeout=20,retries=1)
+    body,err=semrush_request({"type":"api_units","key":api_key},timeout=20,retries=1,client=client)
     if err:
         return "",err
     if not body:
         return "","empty_units_response"
     return body.strip(),""
 
-def semrush_request(params:Dict[str,str],timeout:int=30,retries:int=2)->Tuple[str,str]:
+def semrush_request(params:Dict[str,str],timeout:int=30,retries:int=2,client:SemrushClient|None=None)->Tuple[str,str]:
+    # Report responses are cached per (type, domain, database, display_limit, export_columns) with a
+    # per-report TTL (source "semrush:<type>"); cache_only serves stored bodies regardless of age.
+    client=client or SemrushClient();cache=client.cache
+    report=params.get("type","");cache_params={k:params[k] for k in SEMRUSH_CACHE_KEY_FIELDS if k in params}
+    if cache is not None and report!="api_units":
+        ckey,entry,fresh,_=cache.prepare(SEMRUSH_API_URL,cache_params,f"semrush:{report}")
+        if entry and (fresh or client.cache_only):
+            cache.record("hit");return cache.read_body(entry).decode("utf-8",errors="replace"),""
+    if client.cache_only:return "","semrush_cache_miss"
     if not requests:return "","requests_not_available"
+    getter=client.session.get if client.session is not None else requests.get
     last=""
-    for _ in range(retries+1):
+    for attempt in range(retries+1):
+        if attempt:time.sleep(backoff_delay(attempt,client.backoff_base,client.backoff_max))
+        if client.limiter is not None:client.limiter.acquire()
         try:
-            r=requests.get("https://api.semrush.com/",params=params,timeout=timeout)
+            r=getter(SEMRUSH_API_URL,params=params,timeout=timeout)
             if r.status_code!=200:
                 last=f"http_{r.status_code}"
-                continue
+                if r.status_code==429 or r.status_code>=500:continue
+                break
+            if SEMRUSH_RETRYABLE_ERROR_RE.match(r.text):
+                last=r.text.strip().splitlines()[0][:120];continue
+            # Real results and "ERROR 50 :: NOTHING FOUND" are stable answers; quota/auth errors are not.
+            if cache is not None and report!="api_units" and (not r.text.startswith("ERROR") or r.text.startswith("ERROR 50 ")):
+                cache.store(ckey,display_url(SEMRUSH_API_URL,cache_params),{},r.text.encode("utf-8"),"utf-8",f"semrush:{report}");cache.record("miss")
             return r.text,""
         except Exception as exc:
             last=f"request_error:{exc.__class__.__name__}"
     return "",last or "request_failed"
 
-def semrush_paid_keywords(api_key:str,domain:str,database:str,display_limit:int)->Tuple[List[Dict[str,str]],str]:
-    p={"type":"domain_adwords","key":api_key,"domain":domain,"database":database,"display_limit":str(display_limit),"export_escape":"1","export_columns":"Ph,Po,Pp,Nq,Cp"}
-    b,err=semrush_request(p,timeout=30,retries=2)
-    if err:return [],err
-    if b.startswith("ERROR"):return [],b.strip().replace("\n"," ")
-    lines=[ln.strip() for ln in b.splitlines() if ln.strip()]
-    if not lines:return [],"empty_response"
-    first=[x.strip() for x in lines[0].split(";")]
-    expected={"Ph","Po","Pp","Nq","Cp"}
-    if expected.intersection(set(first)):
-        h=first
-        data_lines=lines[1:]
-    else:
-        # Some accounts return data-only rows without header; map by export_columns order.
-        h=["Ph","Po","Pp","Nq","Cp"]
-        data_lines=lines
-    out=[]
-    for ln in data_lines:
-        parts=[x.strip() for x in ln.split(";")]
-        row={h[i]:parts[i] if i<len(parts) else "" for i in range(len(h))}
-        kw=(row.get("Ph","") or "").strip().strip('"').strip("'").strip()
-        pos=(row.get("Po","") or "").strip().strip('"').strip("'").strip()
-        if kw.lower()=="keyword" and pos.lower()=="position":
-            continue
-        row["Ph"]=kw
-        row["Po"]=pos
-        row["Pp"]=(row.get("Pp","") or "").strip().strip('"').strip("'").strip()
-        row["Nq"]=(row.get("Nq","") or "").strip().strip('"').strip("'").strip()
-        row["Cp"]=(row.get("Cp","") or "").strip().strip('"').strip("'").strip()
-        out.append(row)
-    return out,""
+def semrush_keywords_params(api_key:str,domain:str,database:str,display_limit:int)->Dict[str,str]:
+    return {"type":"domain_adwords","key":api_key,"domain":domain,"database":database,"display_limit":str(display_limit),"export_escape":"1","export_columns":"Ph,Po,Pp,Nq,Cp"}
+
+def semrush_cache_fresh(cache:HttpCache|None,params:Dict[str,str])->bool:
+    if cache is None:return False
+    _,entry,fresh,_=cache.prepare(SEMRUSH_API_URL,{k:params[k] for k in SEMRUSH_CACHE_KEY_FIELDS if k in params},f"semrush:{params.get('type','')}")
+    return bool(entry and fresh)
+
+# Typed column arrays for a domain_adwords export; missing numbers are -1 (ints) or nan (floats).
+SEMRUSH_KEYWORD_COLUMNS=("Ph","Po","Pp","Nq","Cp")
+# Header cells are matched exactly: API codes plus the display labels Semrush writes for them.
+SEMRUSH_HEADER_CODES={**{c:c for c in SEMRUSH_KEYWORD_COLUMNS},"Keyword":"Ph","Position":"Po","Traffic (%)":"Pp","Search Volume":"Nq","CPC":"Cp"}
+SEMRUSH_TOP_KEYWORDS=20
+
+class KeywordTable:
+    __slots__=("keyword","position","traffic_percent","volume","cpc")
+    def __init__(self)->None:
+        self.keyword:List[str]=[];self.position=array("i");self.traffic_percent=array("d");self.volume=array("q");self.cpc=array("d")
+    def __len__(self)->int:return len(self.keyword)
+    def append(self,keyword:str,position:int,traffic_percent:float,volume:int,cpc:float)->None:
+        self.keyword.append(keyword);self.position.append(position);self.traffic_percent.append(traffic_percent);self.volume.append(volume);self.cpc.append(cpc)
+    def records(self,limit:int|None=None)->List[Dict[str,object]]:
+        n=len(self) if limit is None else min(limit,len(self));num=lambda v:None if v!=v else v
+        return [{"keyword":self.keyword[i],"position":None if self.position[i]<0 else self.position[i],"cpc":num(self.cpc[i]),"traffic_percent":num(self.traffic_percent[i])} for i in range(n)]
+    @classmethod
+    def from_top_json(cls,raw:str)->"KeywordTable":
+        # Rebuilds a table from a paid_keywords_top cell (older runs stored every value as a string).
+        t=cls()
+        try:arr=json.loads(raw or "[]")
+        except Exception:arr=[]
+        for o in arr if isinstance(arr,list) else []:
+            if isinstance(o,dict) and str(o.get("keyword") or "").strip():
+                t.append(str(o["keyword"]).strip(),_to_int(o.get("position")),_to_float(o.get("traffic_percent")),-1,_to_float(o.get("cpc")))
+        return t
+
+def _to_int(v)->int:
+    try:return int(float(str(v).strip()))
+    except (TypeError,ValueError):return -1
+
+def _to_float(v)->float:
+    try:return float(str(v).strip())
+    except (TypeError,ValueError):return float("nan")
 
-def semrush_sample_ads(api_key:str,domain:str,database:str,display_limit:int=20)->Tuple[List[str],str]:
-    for t in ["domain_adwords_adwords","domain_adwords_ads","domain_adwords_unique"]:
+def parse_semrush_keywords(body:str)->KeywordTable:
+    # csv honours export_escape=1 quoting (embedded ';' and doubled quotes) while streaming the lines.
+    t=KeywordTable();reader=csv.reader(io.StringIO(body),delimiter=";",quotechar='"');cols=None
+    for parts in reader:
+        parts=[x.strip() for x in parts]
+        if not any(parts):continue
+        if cols is None:
+            codes=[SEMRUSH_HEADER_CODES.get(x) for x in parts]
+            # A header names the keyword column and at least three distinct columns; a data row whose
+            # keyword happens to be "CPC" or "Keyword" does not.
+            if "Ph" in codes and len(set(codes)-{None})>=3:
+                cols={c:i for i,c in enumerate(codes) if c};continue
+            # Some accounts return data-only rows without header; map by export_columns order.
+            cols={c:i for i,c in enumerate(SEMRUSH_KEYWORD_COLUMNS)}
+        cell=lambda c:parts[cols[c]] if c in cols and cols[c]<len(parts) else ""
+        kw=cell("Ph").strip("'").strip()
+        if not kw or (kw.lower()=="keyword" and cell("Po").lower()=="position"):continue
+        t.append(kw,_to_int(cell("Po")),_to_float(cell("Pp")),_to_int(cell("Nq")),_to_float(cell("Cp")))
+    return t
+
+def semrush_paid_keywords(api_key:str,domain:str,database:str,display_limit:int,client:SemrushClient|None=None)->Tuple[KeywordTable,str]:
+    p=semrush_keywords_params(api_key,domain,database,display_limit)
+    b,err=semrush_request(p,timeout=30,retries=2,client=client)
+    if err:return KeywordTable(),err
+    if b.startswith("ERROR"):return KeywordTable(),b.strip().replace("\n"," ")
+    if not b.strip():return KeywordTable(),"empty_response"
+    return parse_semrush_keywords(b),""
+
+# Only these errors say the report type itself is unavailable to the account. Balance, key and limit
+# errors (e.g. ERROR 132 :: API UNITS BALANCE IS ZERO) describe account state and must not be learned.
+SEMRUSH_UNSUPPORTED_ERROR_RE=re.compile(r"^ERROR \d+ :: .*(REPORT TYPE DISABLED|QUERY TYPE NOT FOUND|TYPE NOT AVAILABLE|NOT AVAILABLE FOR THIS)",re.I)
+
+def classify_ads_response(body:str,err:str)->str:
+    if err:return "unknown"
+    if body.startswith("ERROR 50 "):return "ok"
+    if not body.startswith("ERROR"):return "ok"
+    return "unsupported" if SEMRUSH_UNSUPPORTED_ERROR_RE.match(body) else "unknown"
+
+def semrush_sample_ads(api_key:str,domain:str,database:str,display_limit:int=20,client:SemrushClient|None=None)->Tuple[List[str],str]:
+    caps=client.capabilities if client is not None and not client.cache_only else None
+    def fetch(t:str)->Tuple[List[str],str]:
         p={"type":t,"key":api_key,"domain":domain,"database":database,"display_limit":str(display_limit)}
-        b,err=semrush_request(p,timeout=30,retries=1)
-        if err or b.startswith("ERROR"):continue
-        lines=[ln.strip() for ln in b.splitlines() if ln.strip()]
-        if len(lines)>=2:return lines[1:min(len(lines),21)],""
-    return [],"ads_copy_not_supported_or_not_available"
-
-def collect_semrush_signals(competitors:Sequence[Dict[str,str]],api_key:str,database:str,display_limit:int,dry_run_count:int,logger:StepLogger)->List[Dict[str,str]]:
-    domains=[]
+        b,err=semrush_request(p,timeout=30,retries=1,client=client)
+        lines=[ln.strip() for ln in b.splitlines() if ln.strip()] if not err and not b.startswith("ERROR") else []
+        return lines[1:min(len(lines),21)] if len(lines)>=2 else [],classify_ads_response(b,err)
+    if caps is None:
+        for t in SEMRUSH_ADS_REPORT_TYPES:
+            lines,_=fetch(t)
+            if lines:return lines,""
+        return [],"ads_copy_not_supported_or_not_available"
+    key=SemrushCapabilities.key(api_key,database);known=caps.lookup(key)
+    if known is None:
+        # First caller probes the types in order; concurrent callers wait and reuse the answer.
+        with caps.probe_lock(key):
+            known=caps.lookup(key)
+            if known is None:
+                results={}
+                for t in SEMRUSH_ADS_REPORT_TYPES:
+                    lines,results[t]=fetch(t)
+                    if results[t]!="unsupported":break
+                caps.learn(key,results)
+                return (lines,"") if lines else ([],"ads_copy_not_supported_or_not_available")
+    if not known:return [],"ads_copy_not_supported_for_account"
+    lines,_=fetch(known[0])
+    return (lines,"") if lines else ([],"ads_copy_not_available")
+
+# Semrush bills per returned line; api_units itself is free. Used for pre-flight estimates only,
+# the balance is measured once per phase and estimates are rescaled to what was actually charged.
+SEMRUSH_UNIT_COSTS={"domain_adwords":20,"domain_adwords_adwords":20,"domain_adwords_ads":20,"domain_adwords_unique":40,"domain_adwords_history":100}
+SEMRUSH_ADS_LIMIT=20
+SEMRUSH_LEDGER_FIELDS=["run_id","row_type","phase","competitor_name","website_domain","database","display_limit","estimated_units","line_units","measured_units","units_balance","captured_at","note"]
+
+def estimate_semrush_units(display_limit:int,ads_limit:int=SEMRUSH_ADS_LIMIT)->int:
+    return SEMRUSH_UNIT_COSTS["domain_adwords"]*display_limit+SEMRUSH_UNIT_COSTS["domain_adwords_adwords"]*ads_limit
+
+def parse_units(v:str)->int|None:
+    try:return int(str(v).strip())
+    except Exception:return None
+
+# Append-only CSV of Semrush spend: one row per fetched domain, per phase (measured balance delta) and per run.
+class SemrushLedger:
+    def __init__(self,path:Path)->None:
+        self.path=path;self.run_id=dt.datetime.now().strftime("%Y%m%dT%H%M%S");self.run_units=0
+        self.last_fetch:Dict[Tuple[str,str],str]={};self.last_units:Dict[Tuple[str,str,str],int]={}
+        for r in read_csv_rows(path):
+            if r.get("row_type")!="domain":continue
+            k=(r.get("website_domain",""),r.get("database",""))
+            if r.get("captured_at","")>=self.last_fetch.get(k,""):
+                self.last_fetch[k]=r.get("captured_at","");u=parse_units(r.get("line_units",""))
+                if u is not None:self.last_units[k+(r.get("display_limit",""),)]=u
+    def append(self,rows:Sequence[Dict[str,str]])->None:
+        if not rows:return
+        # run_units: line units charged by this run's domain and history fetches, shared by later phases' budgets.
+        self.run_units+=sum(parse_units(r.get("line_units",""))or 0 for r in rows if r.get("row_type") in ("domain","history"))
+        self.path.parent.mkdir(parents=True,exist_ok=True);new=not self.path.exists()
+        with self.path.open("a",newline="",encoding="utf-8") as f:
+            w=csv.DictWriter(f,fieldnames=SEMRUSH_LEDGER_FIELDS)
+            if new:w.writeheader()
+            for r in rows:w.writerow({k:str(r.get(k,"")) for k in SEMRUSH_LEDGER_FIELDS})
+
+def plan_semrush_domains(competitors:Sequence[Dict[str,str]],database:str,last_fetch:Dict[Tuple[str,str],str])->List[Tuple[str,str]]:
+    # Core competitors first, then higher confidence, then least recently fetched (never fetched first).
+    picked={}
     for c in competitors:
         d=normalize_domain(c.get("website_domain","") or c.get("website_url",""))
-        if d:domains.append((c.get("competitor_name",""),d))
-    dedup=[];seen=set()
-    for c,d in domains:
-        if d in seen:continue
-        seen.add(d);dedup.append((c,d))
-    logger.log(f"Quick reconnaissance: competitors={len(competitors)}, with_facebook_page_url={sum(1 for c in competitors if c.get('facebook_page_url'))}, semrush_domains={len(dedup)}, display_limit={display_limit}")
-    rows=[]
-    for phase,items in [("dry-run",dedup[:dry_run_count]),("batch",dedup[dry_run_count:])]:
+        if d and d not in picked:picked[d]=c
+    def priority(item):
+        d,c=item
+        return (0 if match_core_competitor(f"{c.get('competitor_name','')} {d}") else 1,-CompetitorRegistry.SCORE.get(c.get("confidence",""),1),last_fetch.get((d,database),""))
+    return [(c.get("competitor_name",""),d) for d,c in sorted(picked.items(),key=priority)]
+
+def collect_semrush_signals(competitors:Sequence[Dict[str,str]],api_key:str,database:str,display_limit:int,dry_run_count:int,logger:StepLogger,max_units:int=0,existing_rows:Sequence[Dict[str,str]]=(),ledger:SemrushLedger|None=None,min_age_hours:float=0,client:SemrushClient|None=None,workers:int=1)->List[Dict[str,str]]:
+    client=client or SemrushClient();cache_only=client.cache_only
+    last_fetch=ledger.last_fetch if ledger is not None else {}
+    plan=plan_semrush_domains(competitors,database,last_fetch)
+    existing={(r.get("website_domain",""),r.get("database","")):r for r in existing_rows if r.get("paid_keywords_count")}
+    cutoff=(dt.datetime.now()-dt.timedelta(hours=min_age_hours)).isoformat(timespec="seconds") if min_age_hours>0 else ""
+    fresh={d for _,d in plan if cutoff and (d,database) in existing and last_fetch.get((d,database),"")>=cutoff}
+    todo=[(c,d) for c,d in plan if d not in fresh]
+    est_domain=estimate_semrush_units(display_limit);scale=1.0
+    # Per-domain estimate: last charged lines at the same display_limit, else the worst case.
+    last_units=ledger.last_units if ledger is not None else {}
+    def estimate(domain:str)->int:
+        u=last_units.get((domain,database,str(display_limit)))
+        return est_domain if u is None else int(u*scale)
+    logger.log(f"Quick reconnaissance: competitors={len(competitors)}, with_facebook_page_url={sum(1 for c in competitors if c.get('facebook_page_url'))}, semrush_domains={len(plan)}, fresh_skipped={len(fresh)}, display_limit={display_limit}, est_units_per_domain={est_domain}, max_units={max_units or 'unlimited'}, workers={workers}")
+    rows={d:dict(existing[(d,database)]) for d in fresh};ledger_rows=[];spent=0;stopped=False;measured_total:int|None=0;lock=threading.Lock()
+    def fetch_one(item:Tuple[str,str]):
+        # Budget is reserved at the estimate before the request and settled to line units after it.
+        nonlocal spent,stopped
+        comp,domain=item
+        cached=cache_only or semrush_cache_fresh(client.cache,semrush_keywords_params("",domain,database,display_limit))
+        with lock:
+            est=0 if cached else estimate(domain)
+            if stopped or (max_units and spent+est>max_units):
+                if not stopped:logger.log(f"Semrush budget: stopping before {domain}, spent~{spent}+est {est} > max_units {max_units}")
+                stopped=True;return None
+            spent+=est
+        kws,kw_err=semrush_paid_keywords(api_key,domain,database,display_limit,client);copies,ads_err=semrush_sample_ads(api_key,domain,database,SEMRUSH_ADS_LIMIT,client)
+        if kw_err=="semrush_cache_miss" and (domain,database) in existing:return comp,domain,None,None
+        line_units=0 if cached else SEMRUSH_UNIT_COSTS["domain_adwords"]*len(kws)+SEMRUSH_UNIT_COSTS["domain_adwords_adwords"]*len(copies)
+        with lock:spent+=line_units-est
+        top=kws.records(SEMRUSH_TOP_KEYWORDS)
+        sample=copies[:20]
+        if kw_err:sample.append(f"[paid_keywords_error] {kw_err}")
+        if ads_err:sample.append(f"[ads_copy_note] {ads_err}")
+        if not kws and not kw_err:
+            sample.append("[paid_keywords_note] no_paid_keywords_detected")
+        row={"competitor_name":comp,"website_domain":domain,"paid_keywords_top":json.dumps(top,ensure_ascii=False),"paid_keywords_count":str(len(kws)) if kws else "","sample_ad_copies":" || ".join(sample),"database":database,"captured_at":now_iso(),"_keywords":kws}
+        return comp,domain,row,{"row_type":"domain","competitor_name":comp,"website_domain":domain,"database":database,"display_limit":display_limit,"estimated_units":est,"line_units":line_units,"captured_at":row["captured_at"],"note":kw_err or ads_err or ("cache" if cached else "")}
+    for phase,items in [("dry-run",todo[:dry_run_count]),("batch",todo[dry_run_count:])]:
+        if stopped or not items:continue
         logger.log(f"Semrush phase={phase}, domains={len(items)}")
-        for comp,domain in items:
-            before,before_err=semrush_units_info(api_key);kws,kw_err=semrush_paid_keywords(api_key,domain,database,display_limit);copies,ads_err=semrush_sample_ads(api_key,domain,database,20);after,after_err=semrush_units_info(api_key)
-            top=[{"keyword":k.get("Ph",""),"position":k.get("Po",""),"cpc":k.get("Cp",""),"traffic_percent":k.get("Pp","")} for k in kws[:20]]
-            sample=copies[:20]
-            if kw_err:sample.append(f"[paid_keywords_error] {kw_err}")
-            if ads_err:sample.append(f"[ads_copy_note] {ads_err}")
-            if not kws and not kw_err:
-                sample.append("[paid_keywords_note] no_paid_keywords_detected")
-            units_before_val = before if before else ("unavailable:" + (before_err or "unknown"))
-            units_after_val = after if after else ("unavailable:" + (after_err or "unknown"))
-            rows.append({"competitor_name":comp,"website_domain":domain,"paid_keywords_top":json.dumps(top,ensure_ascii=False),"paid_keywords_count":str(len(kws)) if kws else "","sample_ad_copies":" || ".join(sample),"database":database,"units_before":units_before_val,"units_after":units_after_val,"captured_at":now_iso()})
-            logger.log(f"Semrush {phase}: {domain}, keywords={len(kws)}, units_before={(before if before else 'unavailable')}, units_after={(after if after else 'unavailable')}")
-    return rows
+        before,before_err=("","cache_only") if cache_only else semrush_units_info(api_key,client);phase_rows=[];phase_line_units=0;started=time.monotonic()
+        with ThreadPoolExecutor(max_workers=max(1,min(workers,len(items)))) as pool:
+            results=list(pool.map(fetch_one,items))
+        for res in results:
+            if res is None:continue
+            comp,domain,row,lrow=res
+            if row is None:
+                rows[domain]=dict(existing[(domain,database)]);logger.log(f"Semrush {phase}: {domain}, not cached; kept existing row");continue
+            rows[domain]=row;phase_rows.append(row);phase_line_units+=lrow["line_units"];lrow["phase"]=phase;ledger_rows.append(lrow)
+            logger.log(f"Semrush {phase}: {domain}, keywords={row['paid_keywords_count'] or 0}, est_units={lrow['estimated_units']}, line_units={lrow['line_units']}")
+        if not phase_rows:continue
+        after,after_err=("","cache_only") if cache_only else semrush_units_info(api_key,client)
+        b,a=parse_units(before),parse_units(after);measured=b-a if b is not None and a is not None else None
+        if measured is None:measured_total=None
+        else:
+            spent+=measured-phase_line_units;measured_total=None if measured_total is None else measured_total+measured
+            if phase_line_units:scale=max(0.1,measured/phase_line_units)
+        for row in phase_rows:
+            row["units_before"]=before if before else ("unavailable:" + (before_err or "unknown"))
+            row["units_after"]=after if after else ("unavailable:" + (after_err or "unknown"))
+        ledger_rows.append({"row_type":"phase","phase":phase,"database":database,"display_limit":display_limit,"estimated_units":sum(int(r["estimated_units"]) for r in ledger_rows if r["row_type"]=="domain" and r["phase"]==phase),"line_units":phase_line_units,"measured_units":"" if measured is None else measured,"units_balance":after,"captured_at":now_iso(),"note":f"domains={len(phase_rows)}"})
+        logger.log(f"Semrush phase={phase} done: domains={len(phase_rows)} in {time.monotonic()-started:.1f}s, line_units={phase_line_units}, measured_units={'unavailable' if measured is None else measured}, balance={after or 'unavailable'}")
+    for comp,domain in todo:
+        if domain not in rows:
+            prev=existing.get((domain,database))
+            rows[domain]=dict(prev) if prev else {"competitor_name":comp,"website_domain":domain,"paid_keywords_top":"[]","paid_keywords_count":"","sample_ad_copies":"[budget_note] skipped: max_units reached","database":database,"units_before":"","units_after":"","captured_at":now_iso()}
+    ledger_rows.append({"row_type":"run","database":database,"display_limit":display_limit,"line_units":sum(int(r["line_units"]) for r in ledger_rows if r["row_type"]=="domain"),"measured_units":"" if measured_total is None else measured_total,"captured_at":now_iso(),"note":f"fetched={sum(1 for r in ledger_rows if r['row_type']=='domain')}, fresh_skipped={len(fresh)}, budget_stopped={stopped}"})
+    if ledger is not None:
+        for r in ledger_rows:r["run_id"]=ledger.run_id
+        ledger.append(ledger_rows)
+    logger.log(f"Semrush run: spent~{spent} units, fetched={sum(1 for r in ledger_rows if r['row_type']=='domain')}, fresh_skipped={len(fresh)}, budget_stopped={stopped}")
+    return [rows[d] for _,d in plan]
+
+def ingest_semrush_history(domains:Sequence[Tuple[str,str]],api_key:str,database:str,display_limit:int,months:int,logger:StepLogger,store:SemrushHistoryStore,client:SemrushClient|None=None,workers:int=1,max_units:int=0,ledger:SemrushLedger|None=None)->int:
+    # Backfills domain_adwords snapshots (display_date=YYYYMM15) for the last `months` complete months,
+    # requesting only (domain, month) partitions that are not on disk yet. Returns partitions written.
+    jobs=[(comp,d,m) for comp,d in domains for m in store.missing(database,d,recent_months(months))]
+    est=SEMRUSH_UNIT_COSTS["domain_adwords_history"]*display_limit
+    logger.log(f"Semrush history: domains={len(domains)}, months={months}, missing_partitions={len(jobs)}, est_units_per_partition={est}, max_units={max_units or 'unlimited'}")
+    if not jobs:return 0
+    lock=threading.Lock();spent=0;stopped=False
+    def fetch(job:Tuple[str,str,str]):
+        nonlocal spent,stopped
+        comp,domain,month=job
+        with lock:
+            if stopped or (max_units and spent+est>max_units):
+                if not stopped:logger.log(f"Semrush history budget: stopping before {domain} {month}, spent~{spent}+est {est} > max_units {max_units}")
+                stopped=True;return None
+            spent+=est
+        p=semrush_keywords_params(api_key,domain,database,display_limit);p["display_date"]=display_date(month)
+        b,err=semrush_request(p,timeout=30,retries=2,client=client)
+        if err or (b.startswith("ERROR") and not b.startswith("ERROR 50 ")):
+            with lock:spent-=est
+            return job,-1,0,err or b.strip().splitlines()[0][:120]
+        t=KeywordTable() if b.startswith("ERROR") else parse_semrush_keywords(b)
+        store.write(database,domain,month,{"keyword":t.keyword,"position":t.position,"traffic_percent":t.traffic_percent,"volume":t.volume,"cpc":t.cpc})
+        line_units=SEMRUSH_UNIT_COSTS["domain_adwords_history"]*len(t)
+        with lock:spent+=line_units-est
+        return job,len(t),line_units,""
+    with ThreadPoolExecutor(max_workers=max(1,min(workers,len(jobs)))) as pool:
+        results=[r for r in pool.map(fetch,jobs) if r is not None]
+    written=sum(1 for _,n,_,_ in results if n>=0);failed=[f"{d} {m}: {e}" for (_,d,m),n,_,e in results if n<0]
+    if ledger is not None:
+        ledger.append([{"run_id":ledger.run_id,"row_type":"history","phase":m,"competitor_name":c,"website_domain":d,"database":database,"display_limit":display_limit,"estimated_units":est,"line_units":u,"captured_at":now_iso(),"note":e or f"keywords={n}"} for (c,d,m),n,u,e in results])
+    logger.log(f"Semrush history: wrote {written}/{len(jobs)} partitions, spent~{spent} units, failed={len(failed)}, budget_stopped={stopped}")
+    if failed:logger.log("Semrush history failures: "+"; ".join(failed[:10]))
+    return written
 
 def build_semrush_placeholder_rows(competitors:Sequence[Dict[str,str]],database:str,note:str)->List[Dict[str,str]]:
     rows=[];seen=set()
@@ -791,15 +1846,13 @@ def summarize_meta_keywords(rows:Sequence[Dict[str,str]])->Tuple[List[Tuple[str,
     return [(k,c,kwo.get(k,"")) for k,c in kwc.most_common(15)],[(k,c,pho.get(k,"")) for k,c in phc.most_common(10)]
 
 def aggregate_google_intent(rows:Sequence[Dict[str,str]])->Tuple[List[Tuple[str,int]],List[Tuple[str,int]]]:
+    # Fetched rows carry their typed KeywordTable; rows carried over from the CSV are rebuilt once.
     kwc=Counter();ds=defaultdict(int)
     for r in rows:
         d=r.get("website_domain","");ds[d]+=int(r.get("paid_keywords_count","0") or 0)
-        try:arr=json.loads(r.get("paid_keywords_top","") or "[]")
-        except Exception:arr=[]
-        for o in arr:
-            kw=(o.get("keyword") or "").strip().strip('"').strip("'").strip().lower()
-            if kw and kw not in {"keyword"}:
-                kwc[kw]+=1
+        t=r.get("_keywords")
+        if t is None:t=KeywordTable.from_top_json(r.get("paid_keywords_top",""))
+        kwc.update(kw for kw in (k.strip('"').strip("'").strip().lower() for k in t.keyword[:SEMRUSH_TOP_KEYWORDS]) if kw and kw!="keyword")
     return kwc.most_common(20),sorted(ds.items(),key=lambda x:x[1],reverse=True)[:5]
 
 def build_ads_snapshot(path:Path,meta_rows:Sequence[Dict[str,str]],kw_rows:Sequence[Dict[str,str]],sem_rows:Sequence[Dict[str,str]])->None:
@@ -881,19 +1934,36 @@ def generate_report(path:Path,competitors:Sequence[Dict[str,str]],meta_rows:Sequ
     lines.extend(["","## 5) 对我们投放策略的直接启发","","1. Keep Meta objective split at campaign level: Click-to-Message first, Lead Form second, and isolate website traffic for retargeting only.","2. Standardize WhatsApp-first CTA variants in Cantonese + English for HK SMB restaurant owners and test by cuisine cluster.","3. Mirror top competitor intent terms into Google exact/phrase match lists, but route conversion to message-first landing flows.","4. Build ad creative sets around onboarding speed, monthly flexibility, and no hardware lock-in to counter common POS switching friction.","5. Use Meta manual audit queue weekly to capture new offer hooks and rotate copy templates every 14 days."])
     path.parent.mkdir(parents=True,exist_ok=True);path.write_text("\n".join(lines)+"\n",encoding="utf-8")
 
-def extract_zip_if_needed(zip_path:Path,extract_dir:Path,logger:StepLogger)->Path:
-    if not zip_path.exists():logger.log(f"Zip not found at {zip_path}, scanning repo only");return extract_dir
-    extract_dir.mkdir(parents=True,exist_ok=True);marker=extract_dir/".extracted_ok";should=(not marker.exists()) or marker.stat().st_mtime<zip_path.stat().st_mtime
-    if should:
-        with zipfile.ZipFile(zip_path,"r") as zf:zf.extractall(extract_dir)
-        marker.write_text(now_iso(),encoding="utf-8");logger.log(f"Extracted zip: {zip_path} -> {extract_dir}")
-    else:logger.log(f"Using existing extracted directory: {extract_dir}")
-    return extract_dir
+def resolve_scan_root(zip_path:Path,extract_dir:Path,base:Path,logger:StepLogger)->Path:
+    if zip_path.exists() and zipfile.is_zipfile(zip_path):
+        logger.log(f"Scanning zip in place: {zip_path}");return zip_path
+    if extract_dir.exists():
+        logger.log(f"Zip not found at {zip_path}, scanning previously extracted directory: {extract_dir}");return extract_dir
+    logger.log(f"Zip not found at {zip_path}, scanning repo only");return base
 
 def parse_args()->argparse.Namespace:
     p=argparse.ArgumentParser(description="Run HK POS ads intelligence pipeline")
-    p.add_argument("--zip-path",default="../hk-pos-competitive-analysis.zip");p.add_argument("--extract-dir",default="input/extracted_hk_pos_competitive_analysis")
+    p.add_argument("--zip-path",default="../hk-pos-competitive-analysis.zip");p.add_argument("--extract-dir",default="input/extracted_hk_pos_competitive_analysis",help="Legacy extracted copy, scanned only when the zip is missing")
     p.add_argument("--database",default="hk");p.add_argument("--display-limit",type=int,default=200);p.add_argument("--dry-run-count",type=int,default=3);p.add_argument("--timeout-sec",type=int,default=20);p.add_argument("--skip-semrush",action="store_true")
+    p.add_argument("--semrush-cache-only",action="store_true",help="Rebuild Semrush output from cached responses only (zero API calls)");p.add_argument("--semrush-cache-ttl",action="append",default=[],metavar="TYPE=HOURS",help="Cache TTL per Semrush report type, e.g. domain_adwords=72 (repeatable)")
+    p.add_argument("--semrush-workers",type=int,default=4,help="Concurrent Semrush domains");p.add_argument("--semrush-rps",type=float,default=8,help="Account-wide Semrush requests per second (token bucket)")
+    p.add_argument("--semrush-probe-ttl-days",type=float,default=7,help="How long a learned ads-report capability is trusted")
+    p.add_argument("--semrush-history-months",type=int,default=0,help="Backfill this many past months of paid keywords into the history store (0 = off)");p.add_argument("--semrush-history-dir",default="data/semrush_history");p.add_argument("--semrush-history-max-units",type=int,default=20000,help="Unit budget for the history backfill, also capped by what --max-units leaves (0 = unlimited)")
+    p.add_argument("--semrush-history-display-limit",type=int,default=50,help="Keywords per history partition (each line costs 100 units)")
+    p.add_argument("--tag-rules",default="config/tag_rules.tsv",help="Extra proposition tag patterns (TSV tag<TAB>pattern or JSON {tag: [patterns]})")
+    p.add_argument("--copy-dup-threshold",type=float,default=0.6,help="MinHash similarity at which ad copies count as one near-duplicate cluster (0 = no clustering)")
+    p.add_argument("--copy-memo",default="output/copy_memo.json",help="Memo of objective/format/tag results keyed by ad-copy hash and ruleset version");p.add_argument("--no-copy-memo",action="store_true")
+    p.add_argument("--max-units",type=int,default=0,help="Semrush unit budget for this run (0 = unlimited)");p.add_argument("--semrush-min-age-hours",type=float,default=24,help="Reuse existing Semrush rows fetched more recently than this (0 = always refetch)")
+    p.add_argument("--scan-cache",default="output/scan_cache.json",help="Per-file extraction cache for the source scan");p.add_argument("--no-scan-cache",action="store_true",help="Re-parse every source file and leave the cache untouched")
+    p.add_argument("--scan-workers",type=int,default=1,help="Worker processes for source file extraction (1 = serial)")
+    p.add_argument("--enrich-workers",type=int,default=8,help="Concurrent homepage fetches for social-link enrichment")
+    p.add_argument("--enrich-max-kb",type=float,default=512.0,help="Stop reading a homepage after this many KB (0 = no cap)")
+    p.add_argument("--http-cache-dir",default="output/http_cache",help="Shared conditional-GET cache for homepage and Ad Library fetches");p.add_argument("--http-cache-mb",type=float,default=200.0);p.add_argument("--no-http-cache",action="store_true")
+    p.add_argument("--meta-workers",type=int,default=4,help="Concurrent Ad Library fetches");p.add_argument("--meta-breaker-threshold",type=int,default=3,help="Consecutive blocks before the Ad Library circuit opens");p.add_argument("--meta-breaker-cooldown",type=float,default=60.0,help="Seconds before probing Ad Library again")
+    p.add_argument("--meta-max-ads",type=int,default=200,help="Ad cap per advertiser when following Ad Library continuation cursors");p.add_argument("--meta-ad-library-url",default=AD_LIBRARY_BASE_URL,help="Ad Library endpoint (point at scripts/replay_ad_library.py for offline runs)");p.add_argument("--meta-record-dir",default="",help="Save every fetched Ad Library page here for later replay")
+    p.add_argument("--meta-render-fallback",action="store_true",help="Retry dynamic-render Ad Library rows in headless Chromium (needs playwright)");p.add_argument("--meta-render-pool",type=int,default=2,help="Reusable browser contexts for the render fallback (caps memory)")
+    p.add_argument("--ad-store",default="data/meta_ads.sqlite",help="Ad lifecycle store (first_seen/last_seen per ad_archive_id)");p.add_argument("--no-ad-store",action="store_true")
+    p.add_argument("--scan-ignore",default=".scanignore",help="Gitignore-style exclude globs for the source scan");p.add_argument("--scan-max-mb",type=float,default=16.0,help="Skip source files larger than this (0 = no cap)")
     return p.parse_args()
 
 def main()->int:
@@ -905,20 +1975,20 @@ def main()->int:
     stats={"extract_competitors":StepStat("extract_competitors"),"meta_collection":StepStat("meta_collection"),"semrush":StepStat("semrush"),"report":StepStat("report")}
     try:
         zip_path=(base/a.zip_path).resolve();extract_dir=(base/a.extract_dir).resolve()
+        scan_root=resolve_scan_root(zip_path,extract_dir,base,logger)
+        scan_cache=None if a.no_scan_cache else ScanCache((base/a.scan_cache).resolve())
+        scan_ignore=ScanIgnore.load((base/a.scan_ignore).resolve());scan_max_bytes=int(a.scan_max_mb*1024*1024)
+        registry=CompetitorRegistry()
         try:
-            scan_root=extract_zip_if_needed(zip_path,extract_dir,logger)
-        except OSError as exc:
-            logger.log(f"WARN zip extraction failed: {exc}. Fallback to repository root.")
-            scan_root=base
-        if not scan_root.exists():scan_root=base
-        try:
-            competitors=extract_competitors_from_sources(scan_root,logger)
-        except OSError as exc:
+            extract_competitors_from_sources(scan_root,logger,scan_cache,a.scan_workers,scan_ignore,scan_max_bytes,registry)
+        except (OSError,zipfile.BadZipFile) as exc:
             logger.log(f"WARN source scan failed at {scan_root}: {exc}. Fallback to repository root scan.")
-            competitors=extract_competitors_from_sources(base,logger)
-        competitors=normalize_baseline_competitors(competitors)
-        competitors=enrich_social_links(competitors,a.timeout_sec,logger)
-        competitors=normalize_baseline_competitors(competitors)
+            registry=CompetitorRegistry()
+            extract_competitors_from_sources(base,logger,scan_cache,a.scan_workers,scan_ignore,scan_max_bytes,registry)
+        registry.canonicalize()
+        http_cache=None if a.no_http_cache else HttpCache((base/a.http_cache_dir).resolve(),int(a.http_cache_mb*1024*1024),parse_semrush_cache_ttls(a.semrush_cache_ttl))
+        enrich_social_links(registry.rows(),a.timeout_sec,logger,a.enrich_workers,int(a.enrich_max_kb*1024),http_cache)
+        registry.refresh();competitors=registry.rows()
         with_social=sum(1 for c in competitors if c.get("facebook_page_url") or c.get("instagram_handle"))
         coverage=(with_social/len(competitors)) if competitors else 0.0
         missing=[f"{c.get('competitor_name','')} ({c.get('website_domain','')})" for c in competitors if not (c.get("facebook_page_url") or c.get("instagram_handle"))]
@@ -927,35 +1997,70 @@ def main()->int:
             logger.log("Missing social URLs: " + "; ".join(missing))
         write_csv(data_dir/"competitors_master.csv",COMPETITOR_FIELDS,competitors);stats["extract_competitors"].success=len(competitors)
         logger.log(f"Quick reconnaissance: extracted_competitors={len(competitors)}, with_facebook_page_url={sum(1 for c in competitors if c.get('facebook_page_url'))}, planned_semrush_domains={len({normalize_domain(c.get('website_domain','') or c.get('website_url','')) for c in competitors if normalize_domain(c.get('website_domain','') or c.get('website_url',''))})}, display_limit={a.display_limit}")
-        meta_rows,todos=collect_meta_ads(competitors,a.timeout_sec,logger)
+        ad_store=None if a.no_ad_store else AdStore((base/a.ad_store).resolve())
+        tag_matcher=TagMatcher.load((base/a.tag_rules).resolve());copy_memo=None if a.no_copy_memo else CopyMemo((base/a.copy_memo).resolve(),tag_matcher.version)
+        cards_path=data_dir/"meta_ad_cards.csv";with_cards=set()
+        with CsvStreamWriter(cards_path,META_CARD_FIELDS) as card_writer:
+            def card_sink(rows:Sequence[Dict[str,str]])->None:
+                card_writer.write_rows(rows);with_cards.update(r["competitor_name"] for r in rows)
+                if ad_store is not None:ad_store.observe(rows)
+            meta_rows,todos,complete=collect_meta_ads(competitors,a.timeout_sec,logger,http_cache,a.meta_workers,CircuitBreaker(a.meta_breaker_threshold,a.meta_breaker_cooldown),a.meta_max_ads,card_sink,a.meta_ad_library_url,(base/a.meta_record_dir).resolve() if a.meta_record_dir else None,copy_memo)
+            if a.meta_render_fallback:meta_rows,todos=render_meta_fallback(meta_rows,todos,a.timeout_sec,logger,a.meta_render_pool,a.meta_max_ads,card_sink,copy_memo)
+        if ad_store is not None:ad_store.close_out(complete)
+        if http_cache is not None:
+            http_cache.save();logger.log(f"HTTP cache: {http_cache.summary()}")
         existing_todos=read_csv_rows(data_dir/"meta_ads_todo.csv")
         todos=merge_manual_todo_fields(todos,existing_todos)
-        meta_rows=apply_manual_overrides(meta_rows,todos)
+        meta_rows=apply_manual_overrides(meta_rows,todos,ad_store,copy_memo)
+        if ad_store is not None:
+            write_csv(data_dir/"meta_ad_velocity.csv",VELOCITY_FIELDS,ad_store.velocity())
+            logger.log(f"Ad store: {ad_store.summary()}");ad_store.close()
         todos=build_manual_todo_rows(meta_rows)
         todos=merge_manual_todo_fields(todos,existing_todos)
         write_csv(data_dir/"meta_ads_intel.csv",META_FIELDS,meta_rows)
         write_csv(data_dir/"meta_ads_todo.csv",META_FIELDS,todos)
         stats["meta_collection"].success=len([r for r in meta_rows if r.get("collection_method")=="web_auto" or r.get("status")=="active"])
         stats["meta_collection"].failed=len([r for r in meta_rows if r.get("status")!="active"])
-        kw_rows=build_meta_keyword_rows(meta_rows);write_csv(data_dir/"meta_copy_keywords.csv",["row_type","competitor_name","ad_id_or_archive_id","ad_library_url","label_primary","label_secondary","label_reason","count"],kw_rows)
+        # Cards are streamed back from meta_ad_cards.csv (twice when clustering) instead of being held since harvest.
+        clusters=None
+        if a.copy_dup_threshold>0:
+            started=time.monotonic();items=((r.get("competitor_name",""),copy_text(r)) for r in keyword_source_rows(meta_rows,with_cards,iter_csv_rows(cards_path),infer=False))
+            clusters=cluster_near_duplicates(items,a.copy_dup_threshold)
+            logger.log(f"Copy clusters: {len(clusters)} ads -> {len(set(clusters))} near-duplicate clusters in {time.monotonic()-started:.1f}s (threshold {a.copy_dup_threshold})")
+        kw_rows=build_meta_keyword_rows(keyword_source_rows(meta_rows,with_cards,iter_csv_rows(cards_path),copy_memo),tag_matcher,copy_memo,clusters)
+        if copy_memo is not None:copy_memo.save(logger)
+        write_csv(data_dir/"meta_copy_keywords.csv",META_KEYWORD_FIELDS,kw_rows)
         sem_rows=[]
         existing_sem_rows=read_csv_rows(data_dir/"semrush_google_ads_signals.csv")
         if a.skip_semrush:
             logger.log("Semrush stage skipped by argument")
             sem_rows=existing_sem_rows
+        elif a.semrush_cache_only:
+            if http_cache is None:
+                logger.log("Semrush cache-only mode needs the HTTP cache; keeping existing semrush output");sem_rows=existing_sem_rows
+            else:
+                logger.log("Semrush cache-only mode: rebuilding from cached responses, no API calls")
+                sem_rows=collect_semrush_signals(competitors,"",a.database,a.display_limit,a.dry_run_count,logger,0,existing_sem_rows,None,0,SemrushClient(cache=http_cache,cache_only=True))
         else:
             key=os.getenv("SEMRUSH_API_KEY","").strip()
             if not key:
                 logger.log("SEMRUSH_API_KEY is missing; keeping existing semrush output when available")
                 sem_rows=existing_sem_rows or build_semrush_placeholder_rows(competitors,a.database,"missing_semrush_api_key")
             else:
-                u_before,u_before_err=semrush_units_info(key)
-                before_label=u_before if u_before else ("unavailable:" + (u_before_err or "unknown"))
-                logger.log(f"Semrush units before run: {before_label}")
-                sem_rows=collect_semrush_signals(competitors,key,a.database,a.display_limit,a.dry_run_count,logger)
-                u_after,u_after_err=semrush_units_info(key)
-                after_label=u_after if u_after else ("unavailable:" + (u_after_err or "unknown"))
-                logger.log(f"Semrush units after run: {after_label}")
+                with make_http_session(a.semrush_workers) if requests else nullcontext() as session:
+                    capabilities=SemrushCapabilities(out_dir/"semrush_capabilities.json",a.semrush_probe_ttl_days*24*3600)
+                    client=SemrushClient(session,TokenBucket(a.semrush_rps),http_cache,capabilities=capabilities)
+                    units_ledger=SemrushLedger(data_dir/"semrush_units_ledger.csv")
+                    sem_rows=collect_semrush_signals(competitors,key,a.database,a.display_limit,a.dry_run_count,logger,a.max_units,existing_sem_rows,units_ledger,a.semrush_min_age_hours,client,a.semrush_workers)
+                    # The history backfill gets its own budget, capped by whatever --max-units the live run left over.
+                    history_units=a.semrush_history_max_units
+                    if a.max_units:left=max(0,a.max_units-units_ledger.run_units);history_units=min(history_units,left) if history_units else left
+                    if a.semrush_history_months>0 and a.max_units and history_units<=0:logger.log(f"Semrush history skipped: live run spent~{units_ledger.run_units} of max_units {a.max_units}")
+                    elif a.semrush_history_months>0:
+                        ingest_semrush_history(plan_semrush_domains(competitors,a.database,{}),key,a.database,a.semrush_history_display_limit,a.semrush_history_months,logger,SemrushHistoryStore((base/a.semrush_history_dir).resolve()),client,a.semrush_workers,history_units,units_ledger)
+                    capabilities.save()
+        if http_cache is not None and not a.skip_semrush:
+            http_cache.save();logger.log(f"HTTP cache after Semrush: {http_cache.summary()}")
         write_csv(data_dir/"semrush_google_ads_signals.csv",SEMRUSH_FIELDS,sem_rows);stats["semrush"].success=len([r for r in sem_rows if r.get("paid_keywords_count")]);stats["semrush"].failed=len([r for r in sem_rows if not r.get("paid_keywords_count")])
         generate_report(reports_dir/"hk_competitor_ads_summary.md",competitors,meta_rows,kw_rows,sem_rows)
         build_ads_snapshot(base/"docs"/"data"/"ads_snapshot.json",meta_rows,kw_rows,sem_rows)
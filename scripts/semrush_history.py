@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Monthly partitioned store for Semrush paid-keyword history.
+
+Each (database, domain, month) snapshot of ``domain_adwords`` lives in its own partition,
+``<root>/<database>/<domain>/<YYYY-MM>.csv``, with typed columns keyword, position,
+traffic_percent, volume and cpc. A month with no paid keywords is stored as an empty
+partition, so ingestion only ever requests months that have no file yet. Trend questions
+("when did eats365pos.com start bidding on 'pos系統'?") are answered from local files:
+
+    python scripts/semrush_history.py first-seen eats365pos.com "pos系統"
+    python scripts/semrush_history.py trend eats365pos.com "pos系統" --database hk
+    python scripts/semrush_history.py months eats365pos.com
+"""
+
+import argparse
+import csv
+import datetime as dt
+import os
+import re
+from pathlib import Path
+
+DEFAULT_ROOT = Path(__file__).resolve().parent.parent / "data" / "semrush_history"
+PARTITION_FIELDS = ["keyword", "position", "traffic_percent", "volume", "cpc"]
+MONTH_RE = re.compile(r"^\d{4}-\d{2}$")
+
+
+def recent_months(count, today=None):
+    """The `count` most recent complete months, newest first, as 'YYYY-MM'."""
+    today = today or dt.date.today()
+    y, m = today.year, today.month
+    out = []
+    for _ in range(count):
+        m -= 1
+        if m == 0:
+            y, m = y - 1, 12
+        out.append(f"{y:04d}-{m:02d}")
+    return out
+
+
+def display_date(month):
+    """Semrush display_date for a month snapshot (YYYYMM15)."""
+    return month.replace("-", "") + "15"
+
+
+def _cell(v):
+    # Missing numbers arrive as None, nan or the -1 int sentinel; all are stored as "".
+    return "" if v is None or v != v or (not isinstance(v, str) and v == -1) else v
+
+
+class SemrushHistoryStore:
+    def __init__(self, root=DEFAULT_ROOT):
+        self.root = Path(root)
+
+    def partition(self, database, domain, month):
+        return self.root / database / domain / f"{month}.csv"
+
+    def months(self, database, domain):
+        d = self.root / database / domain
+        if not d.is_dir():
+            return []
+        return sorted(p.stem for p in d.glob("*.csv") if MONTH_RE.match(p.stem))
+
+    def missing(self, database, domain, months):
+        have = set(self.months(database, domain))
+        return [m for m in months if m not in have]
+
+    def write(self, database, domain, month, columns):
+        """Write one partition from column lists keyed by PARTITION_FIELDS (atomic replace)."""
+        path = self.partition(database, domain, month)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        with tmp.open("w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(PARTITION_FIELDS)
+            cols = [columns.get(k, []) for k in PARTITION_FIELDS]
+            for row in zip(*cols):
+                w.writerow([_cell(v) for v in row])
+        os.replace(tmp, path)
+
+    def read(self, database, domain, month):
+        """Typed rows of one partition: (keyword, position, traffic_percent, volume, cpc)."""
+        out = []
+        path = self.partition(database, domain, month)
+        if not path.exists():
+            return out
+        with path.open(newline="", encoding="utf-8") as f:
+            for r in csv.DictReader(f):
+                out.append((
+                    r["keyword"],
+                    int(r["position"]) if r["position"] else None,
+                    float(r["traffic_percent"]) if r["traffic_percent"] else None,
+                    int(r["volume"]) if r["volume"] else None,
+                    float(r["cpc"]) if r["cpc"] else None,
+                ))
+        return out
+
+    def trend(self, database, domain, keyword):
+        """[(month, position, cpc)] for every stored month the domain bid on `keyword`."""
+        kw = keyword.strip().lower()
+        out = []
+        for month in self.months(database, domain):
+            for k, pos, _, _, cpc in self.read(database, domain, month):
+                if k.lower() == kw:
+                    out.append((month, pos, cpc))
+                    break
+        return out
+
+    def first_seen(self, database, domain, keyword):
+        t = self.trend(database, domain, keyword)
+        return t[0][0] if t else ""
+
+
+def main():
+    p = argparse.ArgumentParser(description="Query the local Semrush paid-keyword history")
+    p.add_argument("command", choices=["first-seen", "trend", "months"])
+    p.add_argument("domain")
+    p.add_argument("keyword", nargs="?", default="")
+    p.add_argument("--database", default="hk")
+    p.add_argument("--root", default=str(DEFAULT_ROOT))
+    a = p.parse_args()
+    store = SemrushHistoryStore(a.root)
+    if a.command == "months":
+        print("\n".join(store.months(a.database, a.domain)) or "no partitions")
+    elif not a.keyword:
+        p.error(f"{a.command} needs a keyword")
+    elif a.command == "first-seen":
+        print(store.first_seen(a.database, a.domain, a.keyword) or "not seen in stored months")
+    else:
+        for month, pos, cpc in store.trend(a.database, a.domain, a.keyword):
+            print(f"{month}\tposition={pos if pos is not None else '-'}\tcpc={cpc if cpc is not None else '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Dictionary segmenter for Hong Kong restaurant / POS ad copy (Cantonese and Chinese).
+
+Matching runs on text folded from Traditional to Simplified through one precomputed
+``str.translate`` table, so 與/与 and 點餐/点餐 fall on the same dictionary word; callers use
+``fold_zh`` on the returned tokens as the counting key. Each CJK run is cut by forward maximum
+matching against a character trie built from ``BASE_VOCAB`` plus ``config/zh_vocab.txt``
+(one word per line), and tokens are returned in their original surface form. The trie is compiled once and pickled to
+``output/zh_trie.pkl``; later runs load that artifact unless the vocabulary changed.
+Unknown spans between dictionary words are kept whole (two or more characters) instead of
+being expanded into overlapping bigrams.
+"""
+
+import hashlib
+import os
+import pickle
+import re
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_VOCAB_PATH = ROOT / "config" / "zh_vocab.txt"
+DEFAULT_TRIE_PATH = ROOT / "output" / "zh_trie.pkl"
+TRIE_FORMAT = 1
+CJK_RUN_RE = re.compile(r"[一-鿿]+")
+# Function characters that end an unknown span when no dictionary word starts on them.
+BREAK_CHARS = frozenset("的了和及与为是在你您嘅咗喺")
+
+# Traditional -> Simplified pairs for the characters that show up in HK POS / F&B copy.
+FOLD_PAIRS = (
+    "與与 為为 點点 單单 碼码 掃扫 賣卖 統统 機机 設设 備备 銀银 訊讯 詢询 優优 試试 約约 費费 應应 廳厅 "
+    "館馆 飲饮 會会 員员 積积 報报 庫库 業业 務务 營营 雲云 網网 線线 訂订 預预 檯台 枱台 臺台 門门 鋪铺 "
+    "舖铺 貨货 錢钱 結结 帳账 賬账 數数 據据 發发 開开 關关 簡简 時时 間间 輕轻 鬆松 專专 屬属 體体 驗验 "
+    "實实 現现 擊击 選选 擇择 個个 們们 這这 裡里 裏里 還还 無无 從从 電电 話话 腦脑 紙纸 廚厨 顧顾 戶户 "
+    "價价 勢势 創创 資资 計计 劃划 補补 貼贴 請请 詳详 聯联 絡络 幫帮 運运 銷销 廣广 傳传 軟软 達达 載载 "
+    "轉转 換换 團团 隊队 儀仪 讓让 變变 後后 對对 麼么 嗎吗 齊齐 證证 號号 買买 總总 額额 確确 認认 處处 "
+    "層层 樓楼 類类 項项 標标 準准 題题 動动 態态 紅红 獎奖 勵励 權权 級级 戲戏 頁页 場场 區区 內内 來来 "
+    "過过 進进 隨随 僅仅 際际 國国 語语 導导 覽览 攝摄 錄录 視视 頻频 閱阅 讀读 寫写 聽听 說说 議议 協协 "
+    "氣气 車车 貴贵 錯错 斷断 續续 離离 穩稳 連连 鏈链 雙双 維维 護护 興兴 愛爱 熱热 飯饭 麵面 湯汤 雞鸡 "
+    "魚鱼 蝦虾 燒烧 鍋锅 鮮鲜 頭头 檔档 攤摊 燈灯 灣湾 龍龙 東东 島岛 環环 觀观 衝冲 豐丰 滿满 節节 慶庆 "
+    "週周 歲岁 簽签 張张 "
+)
+FOLD_TABLE = str.maketrans({p[0]: p[1] for p in FOLD_PAIRS.split()})
+
+# Dictionary words, written in folded (Simplified) form; config/zh_vocab.txt extends this list.
+BASE_VOCAB = (
+    # POS / product
+    "收银 收银系统 收银机 餐饮系统 餐厅系统 点餐 点餐系统 自助点餐 扫码 扫码点餐 扫码点单 点单 落单 "
+    "埋单 结账 买单 分单 并单 拆单 转台 开台 台号 排队 取号 叫号 预订 订座 订台 会员 会员系统 积分 "
+    "优惠券 电子钱包 库存 库存管理 进货 报表 销售报表 数据分析 数据 后台 云端 云端系统 离线 离线模式 "
+    "厨房 厨房打印 打印机 厨房显示 出单 出品 菜单 电子菜单 多语言 二维码 平板 手机 硬件 软件 设备 "
+    "兼容 整合 对接 系统 方案 解决方案 一站式 功能 模块 设定 安装 培训 上手 快速 简单 容易 稳定 "
+    # payments
+    "支付 收款 电子支付 移动支付 八达通 转数快 支付宝 微信支付 信用卡 现金 找零 手续费 "
+    # delivery
+    "外卖 外送 外卖平台 外卖整合 自取 送餐 "
+    # commercial terms
+    "合约 签约 无合约 免合约 月费 年费 免费 试用 免费试用 优惠 折扣 限时 限时优惠 免费安装 价钱 价格 "
+    "成本 节省 省时 省钱 效率 提升 提升效率 翻台 翻台率 人手 人力 营业额 生意 老板 员工 店铺 "
+    # F&B venues
+    "餐厅 茶餐厅 食肆 餐馆 酒楼 咖啡店 咖啡室 饮品店 甜品店 快餐店 小食店 酒吧 面包店 连锁 连锁店 "
+    "分店 堂食 饮食 饮食业 餐饮 餐饮业 零售 商户 火锅 专门店 开张 新开张 开业 "
+    # contact / CTA
+    "查询 咨询 私信 私讯 联络 联系 预约 示范 了解更多 立即 立即查询 立即申请 申请 登记 下载 "
+    # Cantonese function words (segmented so they do not glue onto neighbours)
+    "我哋 你哋 佢哋 而家 即刻 唔使 唔洗 唔需要 冇问题 点样 边度 乜嘢 咁样 "
+    # places
+    "香港 九龙 新界 港岛 旺角 铜锣湾 尖沙咀 观塘 荃湾 沙田 中环 湾仔"
+)
+
+
+def fold_zh(text):
+    """Fold Traditional characters to their Simplified form (used for matching and counting)."""
+    return (text or "").translate(FOLD_TABLE)
+
+
+def load_vocab(path=DEFAULT_VOCAB_PATH):
+    words = set(BASE_VOCAB.split())
+    path = Path(path) if path else None
+    if path and path.exists():
+        for ln in path.read_text(encoding="utf-8-sig").splitlines():
+            ln = ln.strip()
+            if ln and not ln.startswith("#"):
+                words.add(ln.split()[0])
+    return sorted({fold_zh(w) for w in words if len(w) >= 2})
+
+
+def vocab_version(words):
+    raw = "\n".join([str(TRIE_FORMAT), FOLD_PAIRS] + list(words))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+class ZhSegmenter:
+    """Forward-maximum-matching segmenter over a character trie.
+
+    ``goto[node]`` maps a character to the next node; ``word[node]`` is the dictionary word
+    ending at that node ("" otherwise). Matching walks the folded text; the folding table is
+    one character to one character, so offsets map straight back onto the original text.
+    """
+
+    def __init__(self, words, version=""):
+        self.version = version or vocab_version(words)
+        self.goto = [{}]
+        self.word = [""]
+        for w in words:
+            node = 0
+            for ch in w:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.word.append("")
+                node = nxt
+            self.word[node] = w
+
+    def __len__(self):
+        return sum(1 for w in self.word if w)
+
+    def _longest(self, run, i):
+        """Length of the longest dictionary word starting at run[i] (0 if none)."""
+        node, best = 0, 0
+        goto, word = self.goto, self.word
+        for j in range(i, len(run)):
+            node = goto[node].get(run[j])
+            if node is None:
+                break
+            if word[node]:
+                best = j + 1 - i
+        return best
+
+    def segment_run(self, run, surface=None):
+        """Tokens of one CJK run; unknown spans of two or more characters stay whole.
+
+        `run` is the folded text used for matching; tokens are sliced from `surface` (the
+        original run, same length) when given.
+        """
+        src = run if surface is None else surface
+        out, i, unk = [], 0, -1
+        n = len(run)
+        while i < n:
+            w = self._longest(run, i)
+            if w or run[i] in BREAK_CHARS:
+                if unk >= 0 and i - unk >= 2:
+                    out.append(src[unk:i])
+                unk = -1
+                if w:
+                    out.append(src[i:i + w])
+                i += w or 1
+            else:
+                if unk < 0:
+                    unk = i
+                i += 1
+        if unk >= 0 and n - unk >= 2:
+            out.append(src[unk:])
+        return out
+
+    def segment(self, text):
+        """CJK tokens of `text` in their original form, in order; non-CJK characters are ignored."""
+        out = []
+        for run in CJK_RUN_RE.findall(text or ""):
+            out.extend(self.segment_run(fold_zh(run), run))
+        return out
+
+    # --- precompiled artifact ---------------------------------------------------------
+
+    def save(self, path=DEFAULT_TRIE_PATH):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        with tmp.open("wb") as f:
+            pickle.dump({"version": self.version, "goto": self.goto, "word": self.word}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, vocab_path=DEFAULT_VOCAB_PATH, trie_path=DEFAULT_TRIE_PATH):
+        """Load the pickled trie if it matches the current vocabulary, else rebuild and save it."""
+        words = load_vocab(vocab_path)
+        version = vocab_version(words)
+        if trie_path:
+            try:
+                with Path(trie_path).open("rb") as f:
+                    data = pickle.load(f)
+                if data.get("version") == version:
+                    seg = cls.__new__(cls)
+                    seg.version, seg.goto, seg.word = version, data["goto"], data["word"]
+                    return seg
+            except Exception:
+                pass
+        seg = cls(words, version)
+        if trie_path:
+            try:
+                seg.save(trie_path)
+            except OSError:
+                pass
+        return seg
+
+
+_default = None
+
+
+def default_segmenter():
+    """Process-wide segmenter loaded from the default vocabulary and trie artifact."""
+    global _default
+    if _default is None:
+        _default = ZhSegmenter.load()
+    return _default
+
+
+def segment(text):
+    return default_segmenter().segment(text)
@@ -0,0 +1,79 @@
+import json
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+import run_all  # noqa: E402
+
+
+class FakeResponse:
+    def __init__(self, body, status_code=200):
+        self.text = body
+        self.status_code = status_code
+
+
+class FakeSession:
+    def __init__(self, pages):
+        self.pages = list(pages)
+
+    def get(self, url, timeout=None):
+        return FakeResponse(self.pages.pop(0))
+
+
+def ad_page(result_count, ids, cursor=""):
+    doc = {"result_count": result_count, "results": [{"ad_archive_id": str(i), "snapshot": {"body": {"text": f"ad {i}"}}} for i in ids]}
+    if cursor:
+        doc["forward_cursor"] = cursor
+    return json.dumps(doc)
+
+
+class FetchMetaRowCompletenessTest(unittest.TestCase):
+    def fetch(self, *pages):
+        base = run_all.meta_base_row({"competitor_name": "Acme POS", "facebook_page_url": "https://www.facebook.com/acmepos"})
+        return run_all.fetch_meta_row(base, FakeSession(pages), 5, run_all.CircuitBreaker())
+
+    def test_missing_cursor_with_unlisted_ads_is_incomplete(self):
+        _, _, n_cards, complete = self.fetch(ad_page(57, range(30)))
+        self.assertEqual(n_cards, 30)
+        self.assertFalse(complete)
+
+    def test_every_counted_ad_listed_is_complete(self):
+        _, _, n_cards, complete = self.fetch(ad_page(45, range(30), "c1"), ad_page(45, range(30, 45)))
+        self.assertEqual(n_cards, 45)
+        self.assertTrue(complete)
+
+    def test_zero_results_is_complete(self):
+        _, _, n_cards, complete = self.fetch(ad_page(0, []))
+        self.assertEqual(n_cards, 0)
+        self.assertTrue(complete)
+
+
+class ParseSemrushKeywordsTest(unittest.TestCase):
+    def test_headerless_export_starting_with_label_like_keyword(self):
+        t = run_all.parse_semrush_keywords("cpc;3;1.50;100;2.10\npos;2;1.00;50;1.20\n")
+        self.assertEqual(t.keyword, ["cpc", "pos"])
+        self.assertEqual(list(t.position), [3, 2])
+        self.assertEqual(list(t.volume), [100, 50])
+
+    def test_display_label_header_maps_columns(self):
+        t = run_all.parse_semrush_keywords("Keyword;Search Volume;Position\npos system;90;4\n")
+        self.assertEqual(t.keyword, ["pos system"])
+        self.assertEqual(list(t.position), [4])
+        self.assertEqual(list(t.volume), [90])
+
+
+class SocialLinkScannerTest(unittest.TestCase):
+    def test_href_longer_than_overlap_split_across_chunks(self):
+        body = '<a href="https://www.facebook.com/acmepos/' + "utm_x" * 1500 + '">fb</a> <a href="https://www.instagram.com/acme.pos/">ig</a>'
+        scanner = run_all.SocialLinkScanner()
+        for i in range(0, len(body), 512):
+            scanner.feed(body[i:i + 512])
+        scanner.feed("", final=True)
+        self.assertEqual(scanner.fb_urls, run_all.FB_URL_RE.findall(body))
+        self.assertEqual(scanner.ig_urls, run_all.IG_URL_RE.findall(body))
+
+
+if __name__ == "__main__":
+    unittest.main()